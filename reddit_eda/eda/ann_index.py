@@ -0,0 +1,224 @@
+"""Approximate nearest-neighbour search over saved embeddings (IVF, NumPy only).
+
+The index partitions the (L2-normalized) embeddings into --nlist cells with
+spherical k-means and stores the vectors grouped by cell, so a query only
+scores the rows of the --nprobe cells whose centroids are closest to it. It
+lives next to the embeddings, in <embeddings>.ivf/:
+
+    meta.json       row count, dimension, nlist, and the source file's size/mtime
+    centroids.npy   (nlist, dim) float32 unit centroids
+    offsets.npy     (nlist + 1,) start of each cell in rows.npy / vectors.npy
+    rows.npy        original row number of each stored vector
+    vectors.npy     the unit vectors grouped by cell (float16 unless --float32)
+
+Build once, then query by text (embedded with the same model) or by row:
+
+    python reddit_eda/eda/ann_index.py build --embeddings all_users_embeddings.npy
+    python reddit_eda/eda/ann_index.py query --embeddings all_users_embeddings.npy \\
+        --metadata all_users_with_clusters.csv --text "scared of new foods" -k 10
+    python reddit_eda/eda/ann_index.py query ... --interactive
+
+Results carry user, datetime, subreddit and id from the metadata CSV (rows in
+embedding order, as written by embedding_theme_viz_all_users.py).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLE_PER_CELL = 256
+ASSIGN_CHUNK = 65536
+DEFAULT_NPROBE = 16
+METADATA_COLUMNS = ('user', 'datetime', 'subreddit', 'type', 'id', 'cluster')
+
+
+def index_dir(embeddings_path):
+    return embeddings_path + '.ivf'
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def _assign(vectors, centroids):
+    """Closest centroid (by cosine) of each row, in chunks so a memmap is never loaded whole."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = _normalize(vectors[start:start + ASSIGN_CHUNK])
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, nlist, iterations=KMEANS_ITERATIONS, sample_size=None, seed=0):
+    """Unit centroids fitted on a random sample of rows."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), sample_size or nlist * KMEANS_SAMPLE_PER_CELL)
+    sample = _normalize(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = np.bincount(labels, minlength=nlist) == 0
+        # Re-seed empty cells with random sample rows
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def build_index(embeddings_path, nlist=None, dtype='float16', seed=0):
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    n, dim = embeddings.shape
+    nlist = nlist or int(np.clip(4 * np.sqrt(n), 1, 65536))
+    nlist = min(nlist, n)
+    start = time.perf_counter()
+    centroids = spherical_kmeans(embeddings, nlist, seed=seed)
+    labels = _assign(embeddings, centroids)
+    order = np.argsort(labels, kind='stable')
+    offsets = np.searchsorted(labels[order], np.arange(nlist + 1)).astype(np.int64)
+
+    out_dir = index_dir(embeddings_path)
+    os.makedirs(out_dir, exist_ok=True)
+    vectors = np.lib.format.open_memmap(os.path.join(out_dir, 'vectors.npy'), mode='w+', dtype=dtype, shape=(n, dim))
+    for start_row in range(0, n, ASSIGN_CHUNK):
+        rows = order[start_row:start_row + ASSIGN_CHUNK]
+        vectors[start_row:start_row + len(rows)] = _normalize(embeddings[np.sort(rows)])[np.argsort(np.argsort(rows))]
+    vectors.flush()
+    del vectors
+    np.save(os.path.join(out_dir, 'centroids.npy'), centroids)
+    np.save(os.path.join(out_dir, 'offsets.npy'), offsets)
+    np.save(os.path.join(out_dir, 'rows.npy'), order.astype(np.int64))
+    st = os.stat(embeddings_path)
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump({'n': int(n), 'dim': int(dim), 'nlist': int(nlist), 'dtype': dtype,
+                   'source_size': st.st_size, 'source_mtime': st.st_mtime}, f)
+    print(f"Built IVF index over {n} vectors ({nlist} cells) in {time.perf_counter() - start:.1f}s: {out_dir}")
+    return out_dir
+
+
+class IVFIndex:
+    def __init__(self, embeddings_path):
+        self.directory = index_dir(embeddings_path)
+        with open(os.path.join(self.directory, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        st = os.stat(embeddings_path)
+        if (st.st_size, st.st_mtime) != (self.meta['source_size'], self.meta['source_mtime']):
+            print(f"Warning: {embeddings_path} changed since the index was built; rebuild it", file=sys.stderr)
+        self.centroids = np.load(os.path.join(self.directory, 'centroids.npy'))
+        self.offsets = np.load(os.path.join(self.directory, 'offsets.npy'))
+        self.rows = np.load(os.path.join(self.directory, 'rows.npy'), mmap_mode='r')
+        self.vectors = np.load(os.path.join(self.directory, 'vectors.npy'), mmap_mode='r')
+        self._position = None
+
+    def __len__(self):
+        return self.meta['n']
+
+    def search(self, query, k=10, nprobe=DEFAULT_NPROBE):
+        """(rows, cosine scores) of the k best matches among the nprobe closest cells."""
+        query = _normalize(query).ravel()
+        nprobe = min(nprobe, len(self.centroids))
+        cells = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        spans = [(self.offsets[c], self.offsets[c + 1]) for c in np.sort(cells)]
+        scores = np.concatenate([self.vectors[a:b].astype(np.float32) @ query for a, b in spans])
+        positions = np.concatenate([np.arange(a, b) for a, b in spans])
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=np.int64)
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return np.asarray(self.rows[positions[best]]), scores[best]
+
+    def vector(self, row):
+        """The stored unit vector of an original row."""
+        if self._position is None:
+            self._position = np.empty(len(self), dtype=np.int64)
+            self._position[np.asarray(self.rows)] = np.arange(len(self))
+        return self.vectors[self._position[row]].astype(np.float32)
+
+
+class PostSearch:
+    """Similar-post retrieval: an IVF index plus the rows' metadata and the query model."""
+
+    def __init__(self, embeddings_path, metadata_path, model_name=None, backend='torch'):
+        self.index = IVFIndex(embeddings_path)
+        columns = pd.read_csv(metadata_path, nrows=0).columns
+        self.metadata = pd.read_csv(metadata_path, usecols=[c for c in columns if c in METADATA_COLUMNS + ('text',)])
+        if len(self.metadata) != len(self.index):
+            raise ValueError(f"{metadata_path} has {len(self.metadata)} rows but the index has {len(self.index)}")
+        self.model_name = model_name
+        self.backend = backend
+
+    def embed(self, text):
+        from eda_utils import MODEL_NAME
+        from embedding_cache import normalize_text
+        from embedding_runner import load_model
+        model = load_model(self.model_name or MODEL_NAME, backend=self.backend)
+        # The same text form the stored embeddings were encoded from
+        return model.encode([normalize_text(text)], convert_to_numpy=True, show_progress_bar=False)[0]
+
+    def _results(self, rows, scores):
+        results = self.metadata.iloc[rows].copy()
+        results.insert(0, 'score', scores)
+        results.insert(0, 'row', rows)
+        return results.reset_index(drop=True)
+
+    def search_text(self, text, k=10, nprobe=DEFAULT_NPROBE):
+        return self._results(*self.index.search(self.embed(text), k, nprobe))
+
+    def similar_to(self, row, k=10, nprobe=DEFAULT_NPROBE):
+        rows, scores = self.index.search(self.index.vector(row), k + 1, nprobe)
+        keep = rows != row
+        return self._results(rows[keep][:k], scores[keep][:k])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query an IVF nearest-neighbour index over saved embeddings')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='Build <embeddings>.ivf/')
+    build.add_argument('--embeddings', required=True, help='Path to all_users_embeddings.npy')
+    build.add_argument('--nlist', type=int, default=None, help='Number of cells (default: 4 * sqrt(rows))')
+    build.add_argument('--float32', action='store_true', help='Store index vectors as float32 instead of float16')
+    build.add_argument('--seed', type=int, default=0)
+    query = sub.add_parser('query', help='Top-k similar posts for a text or a row')
+    query.add_argument('--embeddings', required=True, help='Path to all_users_embeddings.npy')
+    query.add_argument('--metadata', required=True, help='CSV with one row per embedding (all_users_with_clusters.csv)')
+    query.add_argument('--text', default=None, help='Query text')
+    query.add_argument('--row', type=int, default=None, help='Query by an embedded row instead of a text')
+    query.add_argument('--interactive', action='store_true', help='Read query texts from stdin, one per line')
+    query.add_argument('-k', type=int, default=10)
+    query.add_argument('--nprobe', type=int, default=DEFAULT_NPROBE, help='Cells scanned per query')
+    query.add_argument('--model', default=None, help='Embedding model (default: the one in eda_utils)')
+    query.add_argument('--backend', default='torch', help='Embedding backend the vectors were made with')
+    query.add_argument('--output', default=None, help='Also write the results to this CSV')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_index(args.embeddings, args.nlist, 'float32' if args.float32 else 'float16', args.seed)
+        return
+
+    if sum([args.text is not None, args.row is not None, args.interactive]) != 1:
+        query.error('give exactly one of --text, --row or --interactive')
+    search = PostSearch(args.embeddings, args.metadata, args.model, args.backend)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_colwidth', 80)
+    queries = iter(sys.stdin.readline, '') if args.interactive else [args.text]
+    for text in queries:
+        start = time.perf_counter()
+        if args.row is not None:
+            results = search.similar_to(args.row, args.k, args.nprobe)
+        else:
+            text = text.strip()
+            if not text:
+                continue
+            results = search.search_text(text, args.k, args.nprobe)
+        print(results.to_string(index=False))
+        print(f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+        if args.output:
+            results.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Assign clusters to posts added since the last full clustering, without reclustering.
+
+embedding_theme_viz_all_users.py --save_umap_model --save_hdbscan_model keeps
+the fitted UMAP reducer and HDBSCAN clusterer. This script finds timeline
+posts that are in neither all_users_with_clusters.csv nor earlier assignment
+runs, embeds them (through the embedding cache), projects them with the saved
+reducer and labels them with hdbscan.approximate_predict. Results are appended
+to the assignments CSV with the same user, id, cluster, membership, umap_x
+and umap_y columns as the clusters CSV:
+
+    python reddit_eda/eda/assign_new_posts.py --user_histories_dir reddit_eda/analysis/user_histories \\
+        --clusters_csv out/all_users_with_clusters.csv \\
+        --umap_model out/global_umap_model.joblib --hdbscan_model out/global_hdbscan_model.joblib
+
+The clusters themselves only change when embedding_theme_viz_all_users.py is
+rerun; the script says so once the assigned posts outgrow --recluster_fraction
+of the clustered ones.
+"""
+import os
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from eda_utils import UMAP_CHUNK, assign_clusters, compute_embeddings, load_all_timelines, transform_umap
+from embedding_cache import CACHE_DIR
+from embedding_runner import BACKENDS, TOKEN_BUDGET
+
+
+def assigned_keys(*paths):
+    """(user, id) pairs already in the given CSVs."""
+    keys = set()
+    for path in paths:
+        if path and os.path.exists(path):
+            df = pd.read_csv(path, usecols=['user', 'id'], dtype={'user': str, 'id': str})
+            keys.update(zip(df['user'], df['id']))
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Label new posts with saved UMAP and HDBSCAN models')
+    parser.add_argument('--user_histories_dir', required=True, help='Directory with *_full_timeline.jsonl files')
+    parser.add_argument('--clusters_csv', required=True, help='all_users_with_clusters.csv of the fitted clustering')
+    parser.add_argument('--umap_model', required=True, help='Saved UMAP reducer (joblib)')
+    parser.add_argument('--hdbscan_model', required=True, help='Saved HDBSCAN clusterer (joblib)')
+    parser.add_argument('--output', default=None,
+                        help='Assignments CSV to append to (default: all_users_new_assignments.csv next to --clusters_csv)')
+    parser.add_argument('--recluster_fraction', type=float, default=0.2,
+                        help='Suggest a full recluster once assigned posts exceed this fraction of clustered ones')
+    parser.add_argument('--cache_dir', default=CACHE_DIR, help='Embedding cache directory')
+    parser.add_argument('--no_cache', action='store_true', help='Encode every text without the embedding cache')
+    parser.add_argument('--token_budget', type=int, default=TOKEN_BUDGET, help='Padded tokens per encoding batch')
+    parser.add_argument('--workers', type=int, default=1, help='Encoding processes (CPU)')
+    parser.add_argument('--threads_per_worker', type=int, default=None, help='Torch threads per encoding process')
+    parser.add_argument('--backend', default='torch', choices=BACKENDS,
+                        help='Embedding backend; must match the one the models were fitted on')
+    parser.add_argument('--umap_chunk_size', type=int, default=UMAP_CHUNK, help='Rows per UMAP transform call')
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(os.path.dirname(args.clusters_csv), 'all_users_new_assignments.csv')
+    df = load_all_timelines(args.user_histories_dir)
+    if df.empty:
+        print('No timelines found.')
+        return
+    df['id'] = df['id'].astype(str)
+    known = assigned_keys(args.clusters_csv, output)
+    new = df[[(user, post_id) not in known for user, post_id in zip(df['user'], df['id'])]]
+    new = new.drop_duplicates(['user', 'id']).reset_index(drop=True)
+    print(f'{len(new)} of {len(df)} timeline posts are not clustered or assigned yet')
+    if not new.empty:
+        embeddings = compute_embeddings(new['text'].astype(str).tolist(), cache_dir=None if args.no_cache else args.cache_dir,
+                                        token_budget=args.token_budget, backend=args.backend, workers=args.workers,
+                                        threads_per_worker=args.threads_per_worker)
+        embedding_2d = transform_umap(joblib.load(args.umap_model), embeddings, args.umap_chunk_size)
+        labels, strengths = assign_clusters(joblib.load(args.hdbscan_model), embedding_2d)
+        out = new.drop(columns=[c for c in ('text', 'context') if c in new.columns])
+        out['cluster'] = labels
+        out['membership'] = strengths
+        out['umap_x'] = embedding_2d[:, 0]
+        out['umap_y'] = embedding_2d[:, 1]
+        if os.path.exists(output):
+            # Keep the columns of the existing file so appended rows line up
+            columns = pd.read_csv(output, nrows=0).columns
+            out.reindex(columns=columns).to_csv(output, mode='a', header=False, index=False)
+        else:
+            out.to_csv(output, index=False)
+        print(f'Assigned {len(out)} posts ({(labels == -1).mean():.0%} noise, '
+              f'median membership {np.median(strengths):.2f}) -> {output}')
+
+    n_clustered = len(assigned_keys(args.clusters_csv))
+    n_assigned = len(known) - n_clustered + len(new)
+    if n_clustered and n_assigned > args.recluster_fraction * n_clustered:
+        print(f'{n_assigned} assigned posts vs {n_clustered} clustered: consider reclustering with '
+              f'embedding_theme_viz_all_users.py --save_umap_model --save_hdbscan_model')
+
+
+if __name__ == '__main__':
+    main()
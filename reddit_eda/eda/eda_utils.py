@@ -1,14 +1,20 @@
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import umap
 import hdbscan
 import matplotlib.pyplot as plt
 import seaborn as sns
 import glob
 import os
+import json
+import hashlib
+from embedding_cache import CACHE_DIR, EmbeddingCache, normalize_text, text_key
+from embedding_runner import TOKEN_BUDGET, cache_model_key, get_runner
 
 MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
+EMBED_CHUNK = 4096  # texts encoded and written per checkpoint
+UMAP_CHUNK = 8192  # rows per UMAP transform call
+ASSIGN_CHUNK = 65536  # points per HDBSCAN approximate_predict call
 
 # --- Data Loading ---
 def load_timeline(jsonl_path):
@@ -29,21 +35,188 @@ def load_all_timelines(user_histories_dir):
         return pd.DataFrame()
 
 # --- Embedding ---
-def compute_embeddings(texts, model_name=MODEL_NAME, batch_size=32):
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(texts, show_progress_bar=True, batch_size=batch_size)
-    return embeddings
+def compute_embeddings(texts, model_name=MODEL_NAME, cache_dir=CACHE_DIR, token_budget=TOKEN_BUDGET,
+                       backend='torch', workers=1, threads_per_worker=None):
+    """Embeddings of texts; with a cache_dir only texts not embedded before are encoded.
+
+    Texts are encoded in normalize_text form (NFC, whitespace runs collapsed)
+    with or without the cache, so vectors do not depend on whether it is on.
+    The tokenizer treats any whitespace run as one separator, so this only
+    changes texts whose Unicode normalization differs.
+
+    workers > 1 encodes across a process pool; backend 'int8' or 'onnx' uses a
+    cheaper CPU model (see embedding_runner.py).
+    """
+    encode = _encoder(model_name, token_budget, backend, workers, threads_per_worker)
+    return _embed(texts, encode, EmbeddingCache(cache_dir, cache_model_key(model_name, backend)) if cache_dir else None)
+
+def _encoder(model_name=MODEL_NAME, token_budget=TOKEN_BUDGET, backend='torch', workers=1, threads_per_worker=None):
+    def encode(batch):
+        return get_runner(model_name, token_budget=token_budget, backend=backend, workers=workers,
+                          threads_per_worker=threads_per_worker).encode(batch)
+    return encode
+
+def _embed(texts, encode, cache=None):
+    if cache is None:
+        return encode([normalize_text(text) for text in texts])
+    return cache.embed(texts, encode)
+
+def embed_to_memmap(texts, path, model_name=MODEL_NAME, cache_dir=CACHE_DIR, token_budget=TOKEN_BUDGET,
+                    chunk_size=EMBED_CHUNK, dtype='float32', **encode_options):
+    """
+    Encodes texts chunk by chunk into a preallocated .npy file at path and
+    returns it as a read-only memmap. After each chunk the file is flushed and
+    <path>.progress.json records how many rows are done, so an interrupted run
+    over the same texts resumes from there.
+    """
+    progress_path = path + '.progress.json'
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(text_key(text))
+    state = {'n': len(texts), 'dtype': dtype, 'model': cache_model_key(model_name, encode_options.get('backend', 'torch')),
+             'texts_sha1': digest.hexdigest(), 'done': 0}
+    out = None
+    if os.path.exists(progress_path) and os.path.exists(path):
+        with open(progress_path, 'r') as f:
+            saved = json.load(f)
+        if {k: v for k, v in saved.items() if k != 'done'} == {k: v for k, v in state.items() if k != 'done'}:
+            state['done'] = saved['done']
+            out = np.lib.format.open_memmap(path, mode='r+')
+            print(f"Resuming embeddings at {state['done']}/{len(texts)}")
+    encode = _encoder(model_name, token_budget, **encode_options)
+    # One cache for all chunks: opening it reads its whole key file
+    cache = EmbeddingCache(cache_dir, state['model']) if cache_dir else None
+    for start in range(state['done'], len(texts), chunk_size):
+        vectors = _embed(texts[start:start + chunk_size], encode, cache)
+        if out is None:
+            out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(len(texts), vectors.shape[1]))
+        out[start:start + len(vectors)] = vectors
+        out.flush()
+        state['done'] = start + len(vectors)
+        with open(progress_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(progress_path + '.tmp', progress_path)
+        print(f"Embedded {state['done']}/{len(texts)} texts")
+    if out is None:  # no texts
+        np.save(path, np.zeros((0, 0), dtype=dtype))
+    del out
+    return np.load(path, mmap_mode='r')
 
 # --- UMAP ---
 def reduce_umap(embeddings, n_neighbors=15, min_dist=0.1, n_components=2, random_state=42):
     reducer = umap.UMAP(n_neighbors=n_neighbors, min_dist=min_dist, n_components=n_components, random_state=random_state)
     return reducer.fit_transform(embeddings)
 
+def fit_umap(embeddings, n_neighbors=15, min_dist=0.1, n_components=2, random_state=42, precomputed_knn=(None, None, None)):
+    """A fitted UMAP reducer (save with joblib.dump, reuse with transform_umap).
+
+    precomputed_knn skips UMAP's own neighbour search (see knn_graph.umap_knn).
+    """
+    reducer = umap.UMAP(n_neighbors=n_neighbors, min_dist=min_dist, n_components=n_components, random_state=random_state,
+                        precomputed_knn=precomputed_knn)
+    return reducer.fit(embeddings)
+
+def transform_umap(reducer, embeddings, chunk_size=UMAP_CHUNK):
+    """Project embeddings into a fitted reducer's space, chunk by chunk.
+
+    reducer is a fitted UMAP or a PCA -> UMAP pipeline from scalable_umap.
+    """
+    out = None
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = reducer.transform(np.asarray(embeddings[start:start + chunk_size], dtype=np.float32))
+        if out is None:
+            out = np.empty((len(embeddings), chunk.shape[1]), dtype=np.float32)
+        out[start:start + len(chunk)] = chunk
+    return out if out is not None else np.zeros((0, 2), dtype=np.float32)
+
+def stratified_sample(groups, n, seed=42):
+    """Sorted row indices of a random sample of about n rows, drawn per group in proportion to its size.
+
+    Every group gets at least one row, so the sample can exceed n when there
+    are many small groups.
+    """
+    codes, _ = pd.factorize(pd.Series(groups))
+    counts = np.bincount(codes)
+    share = min(n, len(codes)) * counts / len(codes)
+    quota = np.floor(share).astype(np.int64)
+    # Largest remainders get the rows that flooring left over
+    quota[np.argsort(quota - share)[:min(n, len(codes)) - quota.sum()]] += 1
+    quota = np.minimum(counts, np.maximum(1, quota))
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(codes))
+    order = order[np.argsort(codes[order], kind='stable')]  # rows grouped, shuffled within each group
+    group_start = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(len(codes)) - group_start[codes[order]]
+    return np.sort(order[rank < quota[codes[order]]])
+
+def scalable_umap(embeddings, groups, sample_size, pca_dim=0, chunk_size=UMAP_CHUNK, n_neighbors=15, min_dist=0.1,
+                  random_state=42):
+    """2-D UMAP of a corpus too large for one fit: (embedding_2d, reducer, sample rows).
+
+    UMAP is fitted on a stratified sample of the rows (groups, e.g. user and
+    month) and every other row is transformed into it in chunks. With
+    pca_dim > 0 the embeddings are first reduced by a PCA fitted on the
+    same sample; the returned reducer is then a PCA -> UMAP pipeline that
+    transform_umap applies to new 768-d embeddings as is.
+    """
+    from sklearn.decomposition import PCA
+    from sklearn.pipeline import make_pipeline
+    sample = stratified_sample(groups, sample_size, random_state)
+    fit_data = np.asarray(embeddings[sample], dtype=np.float32)
+    pca = None
+    if pca_dim:
+        pca = PCA(n_components=pca_dim, random_state=random_state).fit(fit_data)
+        print(f'PCA to {pca_dim} dimensions keeps {pca.explained_variance_ratio_.sum():.1%} of the variance')
+        fit_data = pca.transform(fit_data)
+    print(f'Fitting UMAP on {len(sample)} of {len(embeddings)} points...')
+    umap_model = fit_umap(fit_data, n_neighbors=n_neighbors, min_dist=min_dist, random_state=random_state)
+    reducer = make_pipeline(pca, umap_model) if pca is not None else umap_model
+    embedding_2d = np.empty((len(embeddings), 2), dtype=np.float32)
+    embedding_2d[sample] = umap_model.embedding_
+    rest = np.setdiff1d(np.arange(len(embeddings)), sample)
+    print(f'Transforming the other {len(rest)} points...')
+    for start in range(0, len(rest), chunk_size):
+        rows = rest[start:start + chunk_size]
+        embedding_2d[rows] = reducer.transform(np.asarray(embeddings[rows], dtype=np.float32))
+    return embedding_2d, reducer, sample
+
+def umap_trustworthiness_loss(embeddings, groups, benchmark_size, sample_fraction, pca_dim=0, n_neighbors=15, seed=42):
+    """(full fit, scalable) trustworthiness of 2-D maps of a random benchmark subset.
+
+    The subset is mapped both by one UMAP fit over all of it and by
+    scalable_umap with the same sample fraction and PCA setting, and
+    sklearn's trustworthiness is measured against the original embeddings.
+    """
+    from sklearn.manifold import trustworthiness
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(embeddings), min(benchmark_size, len(embeddings)), replace=False))
+    data = np.asarray(embeddings[rows], dtype=np.float32)
+    full = reduce_umap(data, n_neighbors=n_neighbors, random_state=seed)
+    scaled, _, _ = scalable_umap(data, np.asarray(groups)[rows], max(n_neighbors + 1, int(sample_fraction * len(rows))),
+                                 pca_dim, n_neighbors=n_neighbors, random_state=seed)
+    return (trustworthiness(data, full, n_neighbors=n_neighbors),
+            trustworthiness(data, scaled, n_neighbors=n_neighbors))
+
 # --- HDBSCAN ---
 def cluster_hdbscan(embeddings, min_cluster_size=10):
     clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, prediction_data=True)
     return clusterer.fit_predict(embeddings)
 
+def fit_hdbscan(embeddings, min_cluster_size=10):
+    """A fitted clusterer with prediction data, for saving and assign_clusters."""
+    clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, prediction_data=True)
+    return clusterer.fit(embeddings)
+
+def assign_clusters(clusterer, points, chunk_size=ASSIGN_CHUNK):
+    """(labels, membership strengths) of new points under a fitted clusterer, without refitting."""
+    labels = np.empty(len(points), dtype=np.int64)
+    strengths = np.empty(len(points), dtype=np.float64)
+    for start in range(0, len(points), chunk_size):
+        chunk_labels, chunk_strengths = hdbscan.approximate_predict(clusterer, np.asarray(points[start:start + chunk_size]))
+        labels[start:start + chunk_size] = chunk_labels
+        strengths[start:start + chunk_size] = chunk_strengths
+    return labels, strengths
+
 # --- Plotting ---
 def plot_umap_clusters(embedding_2d, labels, outpath, title='UMAP Embedding with HDBSCAN Clusters'):
     plt.figure(figsize=(10, 8))
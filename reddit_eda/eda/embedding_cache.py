@@ -0,0 +1,126 @@
+"""Persistent, content-addressed cache of sentence embeddings.
+
+Vectors are keyed by (model name, sha1 of the normalized text), so a text is
+encoded once per model no matter which script, user or run it comes from.
+Each model gets a directory under the cache dir holding
+
+    meta.json     {"model": <name>, "dim": <embedding size>}
+    keys.bin      20-byte sha1 digests, one per row
+    vectors.f32   float32 rows in the same order
+
+Both data files are append-only. A run interrupted mid-write leaves at most a
+partial last row, which is dropped on the next load. One writer per cache
+directory at a time.
+"""
+import os
+import json
+import hashlib
+import unicodedata
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'embedding_cache')
+KEY_BYTES = 20
+
+
+def normalize_text(text):
+    """NFC with runs of whitespace collapsed: the text that is hashed and encoded."""
+    return ' '.join(unicodedata.normalize('NFC', str(text)).split())
+
+
+def text_key(text):
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).digest()
+
+
+def _model_dir(cache_dir, model_name):
+    slug = model_name.replace('/', '__')
+    return os.path.join(cache_dir, slug)
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir=CACHE_DIR, model_name=None):
+        self.model_name = model_name
+        self.directory = _model_dir(cache_dir, model_name)
+        self.dim = None
+        self.rows = {}  # digest -> row
+        self._vectors = None
+        meta_path = os.path.join(self.directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.dim = json.load(f)['dim']
+            self._load()
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.directory, 'keys.bin')
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.directory, 'vectors.f32')
+
+    def _load(self):
+        with open(self._keys_path, 'rb') as f:
+            keys = f.read()
+        n = min(len(keys) // KEY_BYTES, os.path.getsize(self._vectors_path) // (4 * self.dim))
+        # Drop a partial row left by an interrupted append
+        for path, size in ((self._keys_path, n * KEY_BYTES), (self._vectors_path, n * 4 * self.dim)):
+            if os.path.getsize(path) > size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        self.rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(n)}
+        self._vectors = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def vectors(self):
+        """All cached vectors as a read-only memmap (rows in insertion order)."""
+        if self._vectors is None or len(self._vectors) != len(self.rows):
+            if not self.rows:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(len(self.rows), self.dim))
+        return self._vectors
+
+    def add(self, keys, vectors):
+        """Append vectors for keys that are not cached yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.dim = int(vectors.shape[1])
+            open(self._keys_path, 'wb').close()
+            open(self._vectors_path, 'wb').close()
+            with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+                json.dump({'model': self.model_name, 'dim': self.dim}, f)
+        new, seen = [], set()
+        for i, key in enumerate(keys):
+            if key not in self.rows and key not in seen:
+                seen.add(key)
+                new.append(i)
+        if not new:
+            return
+        # Vectors go first, so a crash in between leaves vectors without keys,
+        # which the next load drops
+        with open(self._vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors[new]).tobytes())
+        with open(self._keys_path, 'ab') as f:
+            f.write(b''.join(keys[i] for i in new))
+        for i in new:
+            self.rows[keys[i]] = len(self.rows)
+
+    def embed(self, texts, encode):
+        """Embeddings of texts, in order, encoding only cache misses.
+
+        encode is called once with the list of missing normalized texts (each
+        distinct text once) and must return their vectors.
+        """
+        keys = [text_key(text) for text in texts]
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in self.rows and key not in missing:
+                missing[key] = normalize_text(text)
+        print(f"Embedding cache ({self.model_name}): {len(texts) - sum(k in missing for k in keys)} of "
+              f"{len(texts)} texts cached, encoding {len(missing)} new")
+        if missing:
+            self.add(list(missing), encode(list(missing.values())))
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.asarray(self.vectors()[np.array([self.rows[key] for key in keys])])
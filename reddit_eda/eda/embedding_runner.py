@@ -0,0 +1,234 @@
+"""Length-bucketed sentence embedding with one model load per process.
+
+SentenceTransformer.encode pads every batch to its longest text and uses one
+batch size throughout, while Reddit texts run from one-word replies to
+multi-paragraph posts. The runner tokenizes once to get each text's length,
+sorts texts by length and cuts the sorted list into batches whose padded size
+(texts x longest text) stays under a token budget: many short texts per
+batch, few long ones. Vectors come back in the original order, and the model
+is loaded once per process rather than once per call.
+
+    runner = get_runner('sentence-transformers/all-mpnet-base-v2')
+    vectors = runner.encode(texts)   # prints texts/sec when done
+
+For CPU-only machines, workers > 1 fans the batches out over a pool of
+processes, each with its own model copy and a pinned torch thread count, and
+backend selects a cheaper CPU model: 'int8' (dynamically quantized Linear
+layers) or 'onnx' (ONNX Runtime export; needs optimum[onnxruntime]). Check a
+backend's speed and cosine drift against the float32 model with
+
+    python reddit_eda/eda/embedding_runner.py --user_histories_dir reddit_eda/analysis/user_histories --backend int8 --workers 4
+"""
+import os
+import glob
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+try:
+    import optimum.onnxruntime  # noqa: F401
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Padded tokens per batch. On CPU, batches much larger than this run no faster
+# per token, and it caps long-text batches at ~10 texts of all-mpnet-base-v2's
+# 384-token limit instead of 32.
+TOKEN_BUDGET = 4096
+MAX_BATCH_SIZE = 128
+BACKENDS = ('torch', 'int8', 'onnx')
+
+_models = {}
+_runners = {}
+
+
+def load_model(model_name, device=None, backend='torch'):
+    """The SentenceTransformer for model_name on a backend, loaded once per process."""
+    key = (model_name, device, backend)
+    if key not in _models:
+        if backend == 'onnx':
+            if not ONNX_AVAILABLE:
+                raise ImportError("The 'onnx' backend needs onnxruntime: pip install optimum[onnxruntime]")
+            model = SentenceTransformer(model_name, device='cpu', backend='onnx')
+        else:
+            model = SentenceTransformer(model_name, device=device if backend == 'torch' else 'cpu')
+            if backend == 'int8':
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        _models[key] = model
+    return _models[key]
+
+
+def cache_model_key(model_name, backend='torch'):
+    """Embedding cache key of a model: other backends' vectors drift, so they are cached apart."""
+    return model_name if backend == 'torch' else f"{model_name}@{backend}"
+
+
+# Per-worker state of the encoding pool
+_worker_model = None
+
+
+def _init_worker(model_name, backend, threads):
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = load_model(model_name, 'cpu', backend)
+
+
+def _encode_batch(texts):
+    return _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+
+
+def length_batches(lengths, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    """Split text indices, longest first, into batches of at most token_budget padded tokens."""
+    order = np.argsort(-np.asarray(lengths), kind='stable')
+    batches = []
+    start = 0
+    while start < len(order):
+        # Sorted longest first, so a batch's padded length is its first text's
+        size = max(1, min(max_batch_size, token_budget // max(int(lengths[order[start]]), 1)))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+class EmbeddingRunner:
+    def __init__(self, model_name, device=None, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE,
+                 backend='torch', workers=1, threads_per_worker=None):
+        self.model_name = model_name
+        self.backend = backend
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self._pool = None
+        if workers > 1:
+            # The parent only tokenizes; the workers hold the models
+            self.model = load_model(model_name, 'cpu')
+        else:
+            self.model = load_model(model_name, device, backend)
+
+    def _batches_encoded(self, texts, batches):
+        """Yield (batch, vectors) in batch order, in this process or across the pool."""
+        if self.workers <= 1:
+            for batch in batches:
+                yield batch, self.model.encode([texts[j] for j in batch], batch_size=len(batch),
+                                               convert_to_numpy=True, show_progress_bar=False)
+            return
+        if self._pool is None:
+            # spawn: forking a parent that already ran torch can deadlock its thread pools
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker,
+                                             initargs=(self.model_name, self.backend, self.threads_per_worker))
+        results = self._pool.map(_encode_batch, [[texts[j] for j in batch] for batch in batches])
+        yield from zip(batches, results)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def token_lengths(self, texts):
+        """Tokens per text as the model sees them (special tokens included, truncated)."""
+        tokenizer = self.model.tokenizer
+        lengths = np.empty(len(texts), dtype=np.int64)
+        for start in range(0, len(texts), 4096):
+            encoded = tokenizer(texts[start:start + 4096], add_special_tokens=True, truncation=True,
+                                max_length=self.model.max_seq_length)
+            lengths[start:start + 4096] = [len(ids) for ids in encoded['input_ids']]
+        return lengths
+
+    def encode(self, texts, show_progress=True):
+        """float32 embeddings of texts, in input order."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        out = None
+        start_time = time.perf_counter()
+        lengths = self.token_lengths(texts)
+        batches = length_batches(lengths, self.token_budget, self.max_batch_size)
+        done = 0
+        for i, (batch, vectors) in enumerate(self._batches_encoded(texts, batches)):
+            if out is None:
+                out = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[batch] = vectors
+            done += len(batch)
+            if show_progress and (i + 1) % 50 == 0:
+                print(f"  {done}/{len(texts)} texts ({done / (time.perf_counter() - start_time):.1f} texts/sec)")
+        seconds = time.perf_counter() - start_time
+        padded = sum(len(batch) * int(lengths[batch[0]]) for batch in batches)
+        print(f"Encoded {len(texts)} texts in {len(batches)} batches on {self._describe()}, {seconds:.1f}s "
+              f"({len(texts) / seconds:.1f} texts/sec, {lengths.sum() / padded:.0%} of padded tokens real)")
+        return out
+
+    def _describe(self):
+        if self.workers > 1:
+            return f"{self.workers} x {self.threads_per_worker}-thread {self.backend} workers"
+        return f"{self.backend}"
+
+
+def cosine_drift(reference, candidate):
+    """Row-wise cosine similarity of candidate embeddings to reference ones, summarized."""
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    cos = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1) + 1e-12)
+    return {
+        'mean_cosine': float(cos.mean()),
+        'min_cosine': float(cos.min()),
+        'p01_cosine': float(np.percentile(cos, 1)),
+        'max_drift': float(1 - cos.min()),
+    }
+
+
+def get_runner(model_name, device=None, **kwargs):
+    """A runner per (model, device, settings), reused across calls in this process."""
+    key = (model_name, device, tuple(sorted(kwargs.items())))
+    if key not in _runners:
+        _runners[key] = EmbeddingRunner(model_name, device, **kwargs)
+    return _runners[key]
+
+
+def sample_timeline_texts(user_histories_dir, n, seed=0):
+    texts = []
+    for path in sorted(glob.glob(os.path.join(user_histories_dir, '*_full_timeline.jsonl'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            texts.extend(str(json.loads(line).get('text') or '') for line in f)
+    texts = [text for text in texts if text.strip()]
+    rng = np.random.default_rng(seed)
+    return [texts[i] for i in rng.permutation(len(texts))[:n]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time an encoding setup and check its cosine drift against the float32 model')
+    parser.add_argument('--user_histories_dir', required=True, help='Directory with *_full_timeline.jsonl files')
+    parser.add_argument('--model', default='sentence-transformers/all-mpnet-base-v2')
+    parser.add_argument('--sample', type=int, default=2000, help='Texts to encode')
+    parser.add_argument('--backend', default='int8', choices=BACKENDS)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads_per_worker', type=int, default=None)
+    parser.add_argument('--token_budget', type=int, default=TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    texts = sample_timeline_texts(args.user_histories_dir, args.sample)
+    print(f"Reference: {args.model} on torch float32, one process")
+    start = time.perf_counter()
+    reference = EmbeddingRunner(args.model, 'cpu', args.token_budget).encode(texts)
+    reference_seconds = time.perf_counter() - start
+    print(f"Candidate: {args.backend} with {args.workers} worker(s)")
+    runner = EmbeddingRunner(args.model, 'cpu', args.token_budget, backend=args.backend, workers=args.workers,
+                             threads_per_worker=args.threads_per_worker)
+    start = time.perf_counter()
+    candidate = runner.encode(texts)
+    seconds = time.perf_counter() - start
+    runner.close()
+    drift = cosine_drift(reference, candidate)
+    print(f"Speedup {reference_seconds / seconds:.2f}x; cosine to reference: mean {drift['mean_cosine']:.5f}, "
+          f"1st percentile {drift['p01_cosine']:.5f}, min {drift['min_cosine']:.5f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,11 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 import argparse
-from sentence_transformers import SentenceTransformer
-import umap
-import hdbscan
+import joblib
 from tqdm import tqdm
-
-MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
+from eda_utils import UMAP_CHUNK, assign_clusters, compute_embeddings, fit_hdbscan, fit_umap, transform_umap
+from embedding_cache import CACHE_DIR
+from embedding_runner import BACKENDS, TOKEN_BUDGET
 
 
 def load_timeline(jsonl_path):
@@ -18,24 +17,6 @@ def load_timeline(jsonl_path):
     return df
 
 
-def compute_embeddings(texts, model_name=MODEL_NAME):
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(texts, show_progress_bar=True, batch_size=32)
-    return embeddings
-
-
-def reduce_umap(embeddings, n_neighbors=15, min_dist=0.1, n_components=2, random_state=42):
-    reducer = umap.UMAP(n_neighbors=n_neighbors, min_dist=min_dist, n_components=n_components, random_state=random_state)
-    embedding_2d = reducer.fit_transform(embeddings)
-    return embedding_2d
-
-
-def cluster_hdbscan(embeddings):
-    clusterer = hdbscan.HDBSCAN(min_cluster_size=10, prediction_data=True)
-    labels = clusterer.fit_predict(embeddings)
-    return labels
-
-
 def plot_umap_clusters(embedding_2d, labels, outdir, user):
     plt.figure(figsize=(10, 8))
     palette = sns.color_palette('tab20', np.unique(labels).max() + 1)
@@ -53,24 +34,55 @@ def main():
     parser = argparse.ArgumentParser(description='Embedding-based theme visualization for Reddit user timeline')
     parser.add_argument('--input', required=True, help='Path to user JSONL timeline')
     parser.add_argument('--outdir', default='.', help='Directory to save outputs')
+    parser.add_argument('--cache_dir', default=CACHE_DIR, help='Embedding cache directory')
+    parser.add_argument('--no_cache', action='store_true', help='Encode every text without the embedding cache')
+    parser.add_argument('--token_budget', type=int, default=TOKEN_BUDGET, help='Padded tokens per encoding batch')
+    parser.add_argument('--workers', type=int, default=1, help='Encoding processes (CPU)')
+    parser.add_argument('--threads_per_worker', type=int, default=None, help='Torch threads per encoding process')
+    parser.add_argument('--backend', default='torch', choices=BACKENDS, help='float32 torch, int8-quantized torch or ONNX Runtime')
+    parser.add_argument('--global_umap_model', default=None,
+                        help='UMAP reducer fitted on all users (joblib, from embedding_theme_viz_all_users.py --save_umap_model); '
+                             'transforms into its shared space instead of fitting per user')
+    parser.add_argument('--global_hdbscan_model', default=None,
+                        help='HDBSCAN clusterer fitted on all users (joblib, from embedding_theme_viz_all_users.py '
+                             '--save_hdbscan_model); assigns the global clusters instead of clustering per user. '
+                             'Needs --global_umap_model')
+    parser.add_argument('--save_hdbscan_model', default=None, help='Save the per-user HDBSCAN clusterer here (joblib)')
+    parser.add_argument('--umap_chunk_size', type=int, default=UMAP_CHUNK, help='Rows per UMAP transform call')
     parser.add_argument('--user', default='Sareeee48', help='User name for labeling outputs')
     args = parser.parse_args()
+    if args.global_hdbscan_model and not args.global_umap_model:
+        parser.error('--global_hdbscan_model needs --global_umap_model (the clusters live in the global UMAP space)')
 
     os.makedirs(args.outdir, exist_ok=True)
     df = load_timeline(args.input)
     texts = df['text'].astype(str).tolist()
 
     print('Computing embeddings...')
-    embeddings = compute_embeddings(texts)
+    embeddings = compute_embeddings(texts, cache_dir=None if args.no_cache else args.cache_dir,
+                                    token_budget=args.token_budget,
+                                    backend=args.backend, workers=args.workers, threads_per_worker=args.threads_per_worker)
     np.save(os.path.join(args.outdir, f'{args.user}_embeddings.npy'), embeddings)
 
-    print('Reducing dimensionality with UMAP...')
-    embedding_2d = reduce_umap(embeddings)
+    if args.global_umap_model:
+        print('Projecting into the global UMAP space...')
+        embedding_2d = transform_umap(joblib.load(args.global_umap_model), embeddings, args.umap_chunk_size)
+    else:
+        print('Reducing dimensionality with UMAP...')
+        embedding_2d = fit_umap(embeddings).embedding_
     np.save(os.path.join(args.outdir, f'{args.user}_umap2d.npy'), embedding_2d)
 
-    print('Clustering with HDBSCAN...')
-    labels = cluster_hdbscan(embedding_2d)
+    if args.global_hdbscan_model:
+        print('Assigning global HDBSCAN clusters...')
+        labels, strengths = assign_clusters(joblib.load(args.global_hdbscan_model), embedding_2d)
+    else:
+        print('Clustering with HDBSCAN...')
+        clusterer = fit_hdbscan(embedding_2d)
+        labels, strengths = clusterer.labels_, clusterer.probabilities_
+        if args.save_hdbscan_model:
+            joblib.dump(clusterer, args.save_hdbscan_model)
     df['cluster'] = labels
+    df['membership'] = strengths
     df.to_csv(os.path.join(args.outdir, f'{args.user}_with_clusters.csv'), index=False)
 
     print('Plotting UMAP clusters...')
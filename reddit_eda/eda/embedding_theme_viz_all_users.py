@@ -4,12 +4,14 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 import glob
-from sentence_transformers import SentenceTransformer
-import umap
-import hdbscan
+import joblib
 from tqdm import tqdm
+from eda_utils import EMBED_CHUNK, UMAP_CHUNK, embed_to_memmap, fit_hdbscan, fit_umap, scalable_umap, umap_trustworthiness_loss
+from embedding_cache import CACHE_DIR
+from embedding_runner import BACKENDS, TOKEN_BUDGET
+from knn_graph import KNN_K, load_knn_graph, umap_knn
 
-MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
+UMAP_NEIGHBORS = 15
 
 
 def load_all_timelines(user_histories_dir):
@@ -24,24 +26,6 @@ def load_all_timelines(user_histories_dir):
     return all_df
 
 
-def compute_embeddings(texts, model_name=MODEL_NAME):
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(texts, show_progress_bar=True, batch_size=32)
-    return embeddings
-
-
-def reduce_umap(embeddings, n_neighbors=15, min_dist=0.1, n_components=2, random_state=42):
-    reducer = umap.UMAP(n_neighbors=n_neighbors, min_dist=min_dist, n_components=n_components, random_state=random_state)
-    embedding_2d = reducer.fit_transform(embeddings)
-    return embedding_2d
-
-
-def cluster_hdbscan(embeddings):
-    clusterer = hdbscan.HDBSCAN(min_cluster_size=800, prediction_data=True)
-    labels = clusterer.fit_predict(embeddings)
-    return labels
-
-
 def plot_umap_clusters(embedding_2d, labels, users, outdir):
     # Plot by cluster
     plt.figure(figsize=(12, 10))
@@ -74,24 +58,86 @@ def main():
     parser = argparse.ArgumentParser(description='Embedding-based theme visualization for ALL Reddit users')
     parser.add_argument('--user_histories_dir', required=True, help='Directory with *_full_timeline.jsonl files')
     parser.add_argument('--outdir', default='.', help='Directory to save outputs')
+    parser.add_argument('--cache_dir', default=CACHE_DIR, help='Embedding cache directory')
+    parser.add_argument('--no_cache', action='store_true', help='Encode every text without the embedding cache')
+    parser.add_argument('--token_budget', type=int, default=TOKEN_BUDGET, help='Padded tokens per encoding batch')
+    parser.add_argument('--workers', type=int, default=1, help='Encoding processes (CPU)')
+    parser.add_argument('--threads_per_worker', type=int, default=None, help='Torch threads per encoding process')
+    parser.add_argument('--backend', default='torch', choices=BACKENDS, help='float32 torch, int8-quantized torch or ONNX Runtime')
+    parser.add_argument('--chunk_size', type=int, default=EMBED_CHUNK, help='Texts encoded per checkpoint')
+    parser.add_argument('--float16', action='store_true', help='Store the embedding matrix as float16')
+    parser.add_argument('--csv_text', action='store_true', help='Keep the text and context columns in the clusters CSV')
+    parser.add_argument('--save_umap_model', default=None,
+                        help='Save the fitted UMAP reducer here (joblib), for embedding_theme_viz.py --global_umap_model')
+    parser.add_argument('--save_hdbscan_model', default=None,
+                        help='Save the fitted HDBSCAN clusterer here (joblib), for assign_new_posts.py')
+    parser.add_argument('--min_cluster_size', type=int, default=800, help='HDBSCAN min_cluster_size')
+    parser.add_argument('--knn_k', type=int, default=KNN_K,
+                        help='Neighbours in the shared kNN graph (saved next to the embeddings, reused by '
+                             'plot_hdbscan_cluster_counts.py)')
+    parser.add_argument('--umap_sample', type=int, default=0,
+                        help='Fit UMAP on a sample of about this many posts, stratified by user and month, and '
+                             'transform the rest (0: fit on every post)')
+    parser.add_argument('--pca_dim', type=int, default=0, help='PCA-reduce the embeddings to this many dimensions before UMAP (0: off)')
+    parser.add_argument('--umap_chunk_size', type=int, default=UMAP_CHUNK, help='Rows per UMAP transform call')
+    parser.add_argument('--trust_benchmark', type=int, default=5000,
+                        help='With --umap_sample/--pca_dim, compare trustworthiness against a full fit on this many '
+                             'random posts (0: skip)')
     args = parser.parse_args()
+    if args.knn_k < UMAP_NEIGHBORS:
+        parser.error(f'--knn_k must be at least {UMAP_NEIGHBORS} (UMAP n_neighbors)')
 
     os.makedirs(args.outdir, exist_ok=True)
     print('Loading all user timelines...')
     df = load_all_timelines(args.user_histories_dir)
     texts = df['text'].astype(str).tolist()
+    if not args.csv_text:
+        df = df.drop(columns=[c for c in ('text', 'context') if c in df.columns])
 
     print('Computing embeddings...')
-    embeddings = compute_embeddings(texts)
-    np.save(os.path.join(args.outdir, 'all_users_embeddings.npy'), embeddings)
-
-    print('Reducing dimensionality with UMAP...')
-    embedding_2d = reduce_umap(embeddings)
+    # Written chunk by chunk and read back as a memmap, so the matrix is
+    # never held in memory and an interrupted run resumes
+    embeddings_path = os.path.join(args.outdir, 'all_users_embeddings.npy')
+    embeddings = embed_to_memmap(texts, embeddings_path,
+                                 cache_dir=None if args.no_cache else args.cache_dir, token_budget=args.token_budget,
+                                 chunk_size=args.chunk_size, dtype='float16' if args.float16 else 'float32',
+                                 backend=args.backend, workers=args.workers, threads_per_worker=args.threads_per_worker)
+    del texts
+
+    if args.umap_sample or args.pca_dim:
+        print('Reducing dimensionality with sampled UMAP...')
+        strata = (df['user'].astype(str) + ' ' + df['datetime'].dt.to_period('M').astype(str)).to_numpy()
+        embedding_2d, reducer, sample = scalable_umap(embeddings, strata, args.umap_sample or len(embeddings), args.pca_dim,
+                                                      args.umap_chunk_size, n_neighbors=UMAP_NEIGHBORS)
+        if args.trust_benchmark:
+            print(f'Benchmarking trustworthiness on {min(args.trust_benchmark, len(embeddings))} posts...')
+            full, scaled = umap_trustworthiness_loss(embeddings, strata, args.trust_benchmark,
+                                                     len(sample) / len(embeddings), args.pca_dim, UMAP_NEIGHBORS)
+            print(f'Trustworthiness: full fit {full:.4f}, sampled {scaled:.4f} (loss {full - scaled:.4f})')
+    else:
+        # UMAP reuses the saved kNN graph instead of searching neighbours itself; a
+        # reducer that will transform new posts also needs the graph's search index
+        knn_indices, knn_distances, knn_index = load_knn_graph(embeddings_path, args.knn_k,
+                                                               save_index=bool(args.save_umap_model))
+        print('Reducing dimensionality with UMAP...')
+        reducer = fit_umap(embeddings, n_neighbors=UMAP_NEIGHBORS,
+                           precomputed_knn=umap_knn(knn_indices, knn_distances, UMAP_NEIGHBORS, knn_index))
+        embedding_2d = reducer.embedding_
+        del knn_indices, knn_distances, knn_index
+    if args.save_umap_model:
+        joblib.dump(reducer, args.save_umap_model)
+        print(f'Saved UMAP reducer to {args.save_umap_model}')
+    del reducer
     np.save(os.path.join(args.outdir, 'all_users_umap2d.npy'), embedding_2d)
 
     print('Clustering with HDBSCAN...')
-    labels = cluster_hdbscan(embedding_2d)
+    clusterer = fit_hdbscan(embedding_2d, args.min_cluster_size)
+    labels = clusterer.labels_
+    if args.save_hdbscan_model:
+        joblib.dump(clusterer, args.save_hdbscan_model)
+        print(f'Saved HDBSCAN clusterer to {args.save_hdbscan_model}')
     df['cluster'] = labels
+    df['membership'] = clusterer.probabilities_
     df['umap_x'] = embedding_2d[:, 0]
     df['umap_y'] = embedding_2d[:, 1]
     df.to_csv(os.path.join(args.outdir, 'all_users_with_clusters.csv'), index=False)
@@ -0,0 +1,184 @@
+"""One k-nearest-neighbour graph over the embeddings, shared by UMAP and HDBSCAN.
+
+Neighbour search over the 768-d embeddings is most of the clustering
+pipeline's runtime, and UMAP and every HDBSCAN fit used to redo it. The
+graph is computed once with pynndescent (approximate, euclidean, each point
+its own first neighbour, as UMAP computes it) and saved next to the
+embeddings as <embeddings>.knn<k>.npz:
+
+    indices    (n, k) int32 neighbour rows
+    distances  (n, k) float32 euclidean distances
+    source     size and mtime of the embeddings file it was built from
+
+With save_index the pynndescent search index is also kept
+(<embeddings>.knn<k>.index.joblib); UMAP needs it to transform new points
+with a reducer fitted on the graph.
+
+Consumers:
+  - UMAP via precomputed_knn (umap_knn)
+  - HDBSCAN on the raw embeddings via hdbscan_from_knn: core distances are
+    read off the graph and the mutual-reachability spanning tree is built
+    over its edges, so no neighbour search runs per fit
+
+The spanning tree only sees kNN edges, so links between clusters can come
+out longer than exact HDBSCAN's and the cluster selection can shift. With
+enough neighbours it is exact. On 40 heavily overlapping synthetic clusters
+(9k points, min_samples=10), agreement with hdbscan.HDBSCAN (ARI) was 0.39
+at k=30, 0.92 at k=120 and 1.0 at k=250. plot_hdbscan_cluster_counts.py
+therefore builds its tree with an exact hdbscan fit unless given --knn_tree;
+use a larger --k there when the clusters matter more than the build time.
+
+    python reddit_eda/eda/knn_graph.py --embeddings all_users_embeddings.npy --k 30
+"""
+import os
+import time
+import argparse
+import joblib
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+from pynndescent import NNDescent
+
+# Private hdbscan internals (checked against the version pinned in
+# reddit_eda/requirements.txt); without them only full hdbscan fits work
+try:
+    from hdbscan._hdbscan_linkage import label
+    from hdbscan.hdbscan_ import _tree_to_labels
+    HDBSCAN_TREE_AVAILABLE = True
+except ImportError:
+    HDBSCAN_TREE_AVAILABLE = False
+
+KNN_K = 30
+
+
+def knn_graph_path(embeddings_path, k):
+    return f"{embeddings_path}.knn{k}.npz"
+
+
+def _index_path(embeddings_path, k):
+    return f"{embeddings_path}.knn{k}.index.joblib"
+
+
+def _source_stamp(embeddings_path):
+    st = os.stat(embeddings_path)
+    return np.array([st.st_size, st.st_mtime])
+
+
+def compute_knn(embeddings, k=KNN_K, random_state=42):
+    """(indices, distances, NNDescent index) of each row's k nearest rows, itself included."""
+    n = len(embeddings)
+    # asarray passes a float32 memmap through without copying it; NNDescent needs
+    # it writable, so open it with mmap_mode='c' (copy-on-write, see load_knn_graph)
+    data = np.asarray(embeddings, dtype=np.float32)
+    # The settings UMAP uses for its own search
+    index = NNDescent(data, n_neighbors=k, metric='euclidean',
+                      random_state=random_state, n_trees=min(64, 5 + int(round(n ** 0.5 / 20.0))),
+                      n_iters=max(5, int(round(np.log2(n)))), max_candidates=60, compressed=False)
+    indices, distances = index.neighbor_graph
+    return indices.astype(np.int32), distances.astype(np.float32), index
+
+
+def load_knn_graph(embeddings_path, k=KNN_K, save_index=False):
+    """(indices, distances, index) for an embeddings file, computed and saved on first use.
+
+    A saved graph with more neighbours is reused, cut to k. index is None
+    unless save_index is set.
+    """
+    stamp = _source_stamp(embeddings_path)
+    candidates = sorted(int(name[len(os.path.basename(embeddings_path)) + 4:-4])
+                        for name in os.listdir(os.path.dirname(os.path.abspath(embeddings_path)))
+                        if name.startswith(os.path.basename(embeddings_path) + '.knn') and name.endswith('.npz'))
+    for saved_k in candidates:
+        if saved_k < k or (save_index and not os.path.exists(_index_path(embeddings_path, saved_k))):
+            continue
+        with np.load(knn_graph_path(embeddings_path, saved_k)) as saved:
+            if not np.array_equal(saved['source'], stamp):
+                continue
+            print(f"Loaded {saved_k}-NN graph from {knn_graph_path(embeddings_path, saved_k)}")
+            index = joblib.load(_index_path(embeddings_path, saved_k)) if save_index else None
+            return saved['indices'][:, :k], saved['distances'][:, :k], index
+
+    print(f"Computing {k}-NN graph of {embeddings_path}...")
+    start = time.perf_counter()
+    indices, distances, index = compute_knn(np.load(embeddings_path, mmap_mode='c'), k)
+    print(f"  done in {time.perf_counter() - start:.1f}s")
+    np.savez(knn_graph_path(embeddings_path, k), indices=indices, distances=distances, source=stamp)
+    print(f"Saved {knn_graph_path(embeddings_path, k)}")
+    if save_index:
+        joblib.dump(index, _index_path(embeddings_path, k))
+    return indices, distances, index if save_index else None
+
+
+def umap_knn(indices, distances, n_neighbors, index=None):
+    """precomputed_knn argument for umap.UMAP from a graph with at least n_neighbors neighbours."""
+    # UMAP marks disconnected neighbours in these arrays in place, so pass copies
+    return (np.ascontiguousarray(indices[:, :n_neighbors], dtype=np.int32),
+            np.ascontiguousarray(distances[:, :n_neighbors], dtype=np.float32), index)
+
+
+def mutual_reachability_mst(indices, distances, min_samples):
+    """Minimum spanning tree of the mutual-reachability graph over the kNN edges.
+
+    Returns HDBSCAN's (n - 1, 3) [row, row, distance] edge array sorted by
+    distance. Components the kNN graph leaves apart are joined by edges
+    longer than any other, so they only merge at the root.
+    """
+    if min_samples >= indices.shape[1]:
+        raise ValueError(f"min_samples={min_samples} needs a graph of more than {min_samples} neighbours "
+                         f"(this one has {indices.shape[1]})")
+    n = len(indices)
+    # hdbscan's core distance: to the min_samples-th neighbour besides the point itself
+    core = distances[:, min_samples].astype(np.float64)
+    rows = np.repeat(np.arange(n), indices.shape[1] - 1)
+    cols = indices[:, 1:].ravel().astype(np.int64)
+    keep = cols >= 0
+    rows, cols = rows[keep], cols[keep]
+    weights = np.maximum(np.maximum(core[rows], core[cols]), distances[:, 1:].ravel()[keep])
+    # Sparse graphs drop zero weights, so shift every edge up by one
+    graph = coo_matrix((weights + 1.0, (rows, cols)), shape=(n, n)).tocsr()
+    tree = minimum_spanning_tree(graph.maximum(graph.T)).tocoo()
+    edges = np.column_stack([tree.row, tree.col, tree.data - 1.0])
+    n_components, component = connected_components(tree, directed=False)
+    if n_components > 1:
+        top = (edges[:, 2].max() if len(edges) else 0.0) + 1.0
+        roots = np.array([np.flatnonzero(component == c)[0] for c in range(n_components)])
+        edges = np.vstack([edges, np.column_stack([np.full(n_components - 1, roots[0]), roots[1:],
+                                                   np.full(n_components - 1, top)])])
+    return edges[np.argsort(edges[:, 2], kind='stable')]
+
+
+def _require_tree_internals():
+    if not HDBSCAN_TREE_AVAILABLE:
+        raise ImportError("This hdbscan version lacks the tree internals knn_graph.py uses "
+                          "(see reddit_eda/requirements.txt); fit hdbscan.HDBSCAN per size instead")
+
+
+def single_linkage_from_knn(indices, distances, min_samples):
+    """HDBSCAN's single-linkage tree from a kNN graph; it depends on min_samples only."""
+    _require_tree_internals()
+    return label(mutual_reachability_mst(indices, distances, min_samples))
+
+
+def labels_from_tree(single_linkage_tree, min_cluster_size):
+    """(labels, probabilities) of the eom clusters a single-linkage tree gives at min_cluster_size."""
+    _require_tree_internals()
+    labels, probabilities, _, _, _ = _tree_to_labels(None, single_linkage_tree, min_cluster_size)
+    return labels, probabilities
+
+
+def hdbscan_from_knn(indices, distances, min_cluster_size, min_samples):
+    """(labels, probabilities) of an HDBSCAN (eom) clustering computed from a kNN graph."""
+    return labels_from_tree(single_linkage_from_knn(indices, distances, min_samples), min_cluster_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute and save the kNN graph of an embeddings file')
+    parser.add_argument('--embeddings', required=True, help='Path to all_users_embeddings.npy')
+    parser.add_argument('--k', type=int, default=KNN_K, help='Neighbours per point (itself included)')
+    parser.add_argument('--save_index', action='store_true', help='Also keep the search index (for UMAP transform)')
+    args = parser.parse_args()
+    load_knn_graph(args.embeddings, args.k, args.save_index)
+
+
+if __name__ == '__main__':
+    main()
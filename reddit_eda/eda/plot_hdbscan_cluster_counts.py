@@ -3,11 +3,17 @@ import hdbscan
 import matplotlib.pyplot as plt
 import pandas as pd
 import os
+import time
 import argparse
+from joblib import Parallel, delayed
+from knn_graph import HDBSCAN_TREE_AVAILABLE, KNN_K, labels_from_tree, load_knn_graph, single_linkage_from_knn
 
 def count_clusters(labels):
     return len(set(labels)) - (1 if -1 in labels else 0)
 
+def count_clusters_at(single_linkage_tree, min_size):
+    return count_clusters(labels_from_tree(single_linkage_tree, min_size)[0])
+
 def main():
     parser = argparse.ArgumentParser(description='Plot HDBSCAN cluster count vs min_cluster_size')
     parser.add_argument('--embeddings', required=True, help='Path to all_users_embeddings.npy')
@@ -15,25 +21,64 @@ def main():
     parser.add_argument('--min', type=int, default=10, help='Minimum min_cluster_size')
     parser.add_argument('--max', type=int, default=800, help='Maximum min_cluster_size')
     parser.add_argument('--step', type=int, default=25, help='Step size for min_cluster_size')
+    parser.add_argument('--min_samples', type=int, default=10,
+                        help='HDBSCAN min_samples, fixed across the sweep (with --knn_tree, must be below --knn_k)')
+    parser.add_argument('--knn_tree', action='store_true',
+                        help='Build the tree from the shared kNN graph instead of one hdbscan.HDBSCAN fit: faster, '
+                             'but approximate (see knn_graph.py)')
+    parser.add_argument('--knn_k', type=int, default=KNN_K, help='Neighbours in the shared kNN graph (with --knn_tree)')
+    parser.add_argument('--full_fit', action='store_true',
+                        help='Fit hdbscan.HDBSCAN on the raw embeddings for every size (min_samples = min_cluster_size) '
+                             'instead of sweeping one tree')
+    parser.add_argument('--jobs', type=int, default=-1, help='Processes condensing the tree (-1: all CPUs)')
     args = parser.parse_args()
+    if args.knn_tree and not args.full_fit and args.min_samples >= args.knn_k:
+        parser.error('--min_samples must be below --knn_k')
+
+    if not args.full_fit and not HDBSCAN_TREE_AVAILABLE:
+        print(f"Error: hdbscan {getattr(hdbscan, '__version__', '')} lacks the tree internals the single-tree "
+              "sweep uses (pinned in reddit_eda/requirements.txt); falling back to --full_fit")
+        args.full_fit = True
 
     os.makedirs(args.outdir, exist_ok=True)
-    embeddings = np.load(args.embeddings)
     min_sizes = list(range(args.min, args.max + 1, args.step))
-    results = []
-    for min_size in min_sizes:
-        clusterer = hdbscan.HDBSCAN(min_cluster_size=min_size, prediction_data=True)
-        labels = clusterer.fit_predict(embeddings)
-        n_clusters = count_clusters(labels)
-        results.append({'min_cluster_size': min_size, 'n_clusters': n_clusters})
-        print(f"min_cluster_size={min_size}: n_clusters={n_clusters}")
+    start = time.perf_counter()
+    if args.full_fit:
+        embeddings = np.load(args.embeddings, mmap_mode='r')
+        counts = []
+        for min_size in min_sizes:
+            clusterer = hdbscan.HDBSCAN(min_cluster_size=min_size, prediction_data=True)
+            counts.append(count_clusters(clusterer.fit_predict(embeddings)))
+            print(f"min_cluster_size={min_size}: n_clusters={counts[-1]}")
+    else:
+        # The mutual-reachability MST and its single-linkage tree depend on
+        # min_samples only, so they are built once; each size just condenses
+        # the tree and selects clusters, which is cheap and runs in parallel
+        if args.knn_tree:
+            knn_indices, knn_distances, _ = load_knn_graph(args.embeddings, args.knn_k)
+            single_linkage_tree = single_linkage_from_knn(knn_indices, knn_distances, args.min_samples)
+            del knn_indices, knn_distances
+        else:
+            clusterer = hdbscan.HDBSCAN(min_cluster_size=min_sizes[0], min_samples=args.min_samples)
+            single_linkage_tree = clusterer.fit(np.load(args.embeddings, mmap_mode='r'))._single_linkage_tree
+        print(f"Built the single-linkage tree in {time.perf_counter() - start:.1f}s")
+        counts = Parallel(n_jobs=args.jobs)(delayed(count_clusters_at)(single_linkage_tree, min_size)
+                                            for min_size in min_sizes)
+        for min_size, n_clusters in zip(min_sizes, counts):
+            print(f"min_cluster_size={min_size}: n_clusters={n_clusters}")
+    print(f"Swept {len(min_sizes)} sizes in {time.perf_counter() - start:.1f}s")
+    results = [{'min_cluster_size': min_size, 'n_clusters': n_clusters} for min_size, n_clusters in zip(min_sizes, counts)]
     df = pd.DataFrame(results)
     df.to_csv(os.path.join(args.outdir, 'hdbscan_cluster_counts_vs_min_size.csv'), index=False)
     plt.figure(figsize=(8, 5))
     plt.plot(df['min_cluster_size'], df['n_clusters'], marker='o')
     plt.xlabel('min_cluster_size')
     plt.ylabel('Number of clusters (excluding noise)')
-    plt.title('HDBSCAN: Number of clusters vs min_cluster_size')
+    if args.full_fit:
+        setting = 'min_samples = min_cluster_size'
+    else:
+        setting = f"min_samples = {args.min_samples}" + (f", approximate {args.knn_k}-NN tree" if args.knn_tree else '')
+    plt.title(f'HDBSCAN: Number of clusters vs min_cluster_size ({setting})')
     plt.grid(True)
     plt.tight_layout()
     plt.savefig(os.path.join(args.outdir, 'hdbscan_cluster_counts_vs_min_size.png'))
@@ -41,4 +86,4 @@ def main():
     print(f"Done. Outputs saved to {args.outdir}")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -6,6 +6,7 @@ import re
 import nltk
 nltk.download('stopwords')
 from nltk.corpus import stopwords
+from eda_utils import load_all_timelines
 
 STOPWORDS = set(stopwords.words('english'))
 WORD_RE = re.compile(r"\b\w+\b")
@@ -25,10 +26,23 @@ def main():
     parser.add_argument('--input', required=True, help='Path to all_users_with_clusters.csv')
     parser.add_argument('--outdir', default='.', help='Directory to save outputs')
     parser.add_argument('--topn', type=int, default=20, help='Number of top terms per cluster')
+    parser.add_argument('--user_histories_dir', default=None, help='Timelines to take texts from when the CSV has no text column')
     args = parser.parse_args()
 
     os.makedirs(args.outdir, exist_ok=True)
     df = pd.read_csv(args.input)
+    if 'text' not in df.columns:
+        if not args.user_histories_dir:
+            parser.error('the CSV has no text column; pass --user_histories_dir')
+        texts = load_all_timelines(args.user_histories_dir)[['user', 'id', 'text']]
+        # Both sides may have inferred numeric ids or user names; compare as strings
+        for frame in (df, texts):
+            frame['user'] = frame['user'].astype(str)
+            frame['id'] = frame['id'].astype(str)
+        df = df.merge(texts.drop_duplicates(['user', 'id']), on=['user', 'id'], how='left')
+        missing = df['text'].isna().sum()
+        if missing:
+            print(f"Warning: {missing} of {len(df)} rows have no text in {args.user_histories_dir}")
 
     summaries = []
     for cluster in sorted(df['cluster'].unique()):
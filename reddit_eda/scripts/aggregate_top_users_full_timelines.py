@@ -1,101 +1,156 @@
 import os
 import json
+import heapq
+import shutil
+import argparse
 import datetime
-from collections import Counter, defaultdict
+import tempfile
+import numpy as np
+from corpus_index import ANALYSIS_DIR, IGNORE_USERS, POST, load_or_build_index, most_common
+from time_buckets import window_start
+from thread_store import ThreadStoreWriter, load_thread
 
-BASE_DIR = os.path.join(os.path.dirname(__file__), '../database/')
-ANALYSIS_DIR = os.path.join(os.path.dirname(__file__), '../analysis/')
-subreddits = ["AnorexiaNervosa", "ARFID", "bulimia", "EatingDisorders", "fuckeatingdisorders"]
-ignore_users = {"AutoModerator", "EDPostRequests", "AnorexiaNervosa-ModTeam", "fuckeatingdisorders-ModTeam"}
+def timeline_event(index, row, thread, inline_context=False):
+    """One timeline record; comment context is a reference into `thread` unless inline."""
+    created_utc = float(index.created_utc[row])
+    event = {
+        'type': 'post' if index.type[row] == POST else 'comment',
+        'timestamp': created_utc,
+        'datetime': datetime.datetime.utcfromtimestamp(created_utc).isoformat(),
+        'subreddit': index.subreddits[index.subreddit[row]],
+    }
+    if index.type[row] == POST:
+        event.update({
+            'id': str(index.post_id[row]),
+            'text': index.text(row),
+            'title': index.title(row),
+            'context': None
+        })
+        return event, ()
+    parent_id = str(index.parent_id[row]) or None
+    chain = thread().ancestors(parent_id) if parent_id and parent_id.startswith('t1_') else ()
+    if not chain:
+        context = None
+    elif inline_context:
+        context = thread().context(chain)
+    else:
+        context = {'thread': thread().post_id, 'ancestors': list(chain)}
+    event.update({
+        'id': str(index.comment_id[row]),
+        'text': index.text(row),
+        'parent_id': parent_id,
+        'link_id': str(index.link_id[row]) or None,
+        'context': context
+    })
+    return event, chain
 
-now = datetime.datetime.utcnow()
-five_years_ago = now - datetime.timedelta(days=5*365)
+class TimelineSpiller:
+    """Buffers serialized events per author and spills sorted runs to disk.
 
-def build_comment_context(comment, comment_lookup):
-    context = []
-    current = comment
-    while True:
-        parent_id = current.get('parent_id')
-        if parent_id and parent_id.startswith('t1_'):
-            parent_comment_id = parent_id[3:]
-            parent = comment_lookup.get(parent_comment_id)
-            if parent:
-                context.append({
-                    'id': parent.get('id'),
-                    'author': parent.get('author'),
-                    'body': parent.get('body'),
-                    'created_utc': parent.get('created_utc')
-                })
-                current = parent
-            else:
-                break
-        else:
-            break
-    return list(reversed(context))
+    Events are keyed by (timestamp, seq) so merging the runs reproduces a
+    stable sort by timestamp. Buffered lines never exceed budget_bytes.
+    """
 
-# 1. Count posts+comments per user in last 5 years
-total_counts = Counter()
-user_events = defaultdict(list)
+    def __init__(self, spill_dir, budget_bytes):
+        self.spill_dir = spill_dir
+        self.budget_bytes = budget_bytes
+        self.buffers = {}
+        self.buffered_bytes = 0
+        self.runs = {}
 
-for subreddit in subreddits:
-    sub_dir = os.path.join(BASE_DIR, subreddit)
-    if not os.path.isdir(sub_dir):
-        continue
-    for fname in os.listdir(sub_dir):
-        if not fname.endswith('.json'):
-            continue
-        with open(os.path.join(sub_dir, fname), 'r') as f:
-            data = json.load(f)
-            # Post
-            author = data.get('author')
-            created_utc = data.get('created_utc')
-            if author and author != 'None' and author not in ignore_users and created_utc:
-                dt = datetime.datetime.utcfromtimestamp(created_utc)
-                if dt >= five_years_ago:
-                    user_events[author].append({
-                        'type': 'post',
-                        'timestamp': created_utc,
-                        'datetime': dt.isoformat(),
-                        'subreddit': subreddit,
-                        'id': data.get('id'),
-                        'text': data.get('selftext', ''),
-                        'title': data.get('title', ''),
-                        'context': None
-                    })
-                    total_counts[author] += 1
-            # Build comment lookup for context
-            comment_lookup = {c['id']: c for c in data.get('comments', []) if 'id' in c}
-            # Comments
-            for comment in data.get('comments', []):
-                c_author = comment.get('author')
-                c_created_utc = comment.get('created_utc')
-                if c_author and c_author != 'None' and c_author not in ignore_users and c_created_utc:
-                    dt = datetime.datetime.utcfromtimestamp(c_created_utc)
-                    if dt >= five_years_ago:
-                        context = build_comment_context(comment, comment_lookup)
-                        user_events[c_author].append({
-                            'type': 'comment',
-                            'timestamp': c_created_utc,
-                            'datetime': dt.isoformat(),
-                            'subreddit': subreddit,
-                            'id': comment.get('id'),
-                            'text': comment.get('body', ''),
-                            'parent_id': comment.get('parent_id'),
-                            'link_id': comment.get('link_id'),
-                            'context': context if context else None
-                        })
-                        total_counts[c_author] += 1
+    def add(self, author, timestamp, seq, line):
+        self.buffers.setdefault(author, []).append((timestamp, seq, line))
+        self.buffered_bytes += len(line)
+        if self.buffered_bytes > self.budget_bytes:
+            self.spill()
 
-# 2. Get top 100 users by total posts+comments
-top_users = [user for user, _ in total_counts.most_common(100)]
+    def spill(self):
+        for author, events in self.buffers.items():
+            events.sort()
+            path = os.path.join(self.spill_dir, f"{author}_{len(self.runs.get(author, []))}.run")
+            with open(path, 'w', encoding='utf-8') as f:
+                for timestamp, seq, line in events:
+                    f.write(f"{timestamp!r}\t{seq}\t{line}\n")
+            self.runs.setdefault(author, []).append(path)
+        self.buffers = {}
+        self.buffered_bytes = 0
 
-# 3. Output one JSONL file per user
-os.makedirs(ANALYSIS_DIR, exist_ok=True)
-for user in top_users:
-    events = user_events[user]
-    events.sort(key=lambda e: e['timestamp'])
-    out_path = os.path.join(ANALYSIS_DIR, f"{user}_full_timeline.jsonl")
-    with open(out_path, 'w', encoding='utf-8') as f:
-        for event in events:
-            f.write(json.dumps(event, ensure_ascii=False) + '\n')
-    print(f"Saved full timeline for {user} to {out_path}") 
\ No newline at end of file
+    def merged(self, author):
+        """Yield one author's serialized events in (timestamp, seq) order."""
+        runs = [_read_run(path) for path in self.runs.get(author, [])]
+        runs.append(iter(sorted(self.buffers.pop(author, []))))
+        for _, _, line in heapq.merge(*runs):
+            yield line
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for record in f:
+            timestamp, seq, line = record.rstrip('\n').split('\t', 2)
+            yield float(timestamp), int(seq), line
+
+def main():
+    parser = argparse.ArgumentParser(description='Write full timelines for the most active users')
+    parser.add_argument('--top_n', type=int, default=100, help='Number of most active users to write timelines for')
+    parser.add_argument('--years', type=float, default=5, help='Only count and include activity from the last N years')
+    parser.add_argument('--memory_budget_mb', type=float, default=256, help='Max serialized events held in memory before spilling to disk')
+    parser.add_argument('--spill_dir', default=None, help='Directory for temporary sorted runs (default: a temp dir)')
+    parser.add_argument('--outdir', default=ANALYSIS_DIR, help='Directory to write *_full_timeline.jsonl files to')
+    parser.add_argument('--inline_context', action='store_true', help='Copy ancestor comments into each event instead of writing threads.jsonl')
+    args = parser.parse_args()
+
+    cutoff = window_start(args.years*365)
+
+    # 1. Count posts+comments per user in the window (index columns only)
+    index = load_or_build_index()
+    rows = np.flatnonzero(
+        index.author_mask(IGNORE_USERS)
+        & (index.created_utc > 0)
+        & (index.created_utc >= cutoff)
+    )
+
+    # 2. Get top N users by total posts+comments
+    top_codes, _ = most_common(index.author[rows], args.top_n)
+
+    # 3. Stream the selected users' events in corpus order into per-user runs.
+    # Corpus order keeps each post file's rows together, so its thread (and
+    # its memoized ancestor chains) is built once for every selected user
+    # commenting in it, and its referenced comments are written to the
+    # thread store once.
+    os.makedirs(args.outdir, exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix='timelines_', dir=args.spill_dir)
+    spiller = TimelineSpiller(spill_dir, int(args.memory_budget_mb * 1024 * 1024))
+    store = None if args.inline_context else ThreadStoreWriter(os.path.join(args.outdir, 'threads.jsonl'))
+    selected = rows[np.isin(index.author[rows], top_codes)]
+    current = {'file': None, 'thread': None, 'referenced': set()}
+    def thread():
+        if current['thread'] is None:
+            current['thread'] = load_thread(index, current['file'])
+        return current['thread']
+    try:
+        for row in selected:
+            file_code = int(index.file[row])
+            if file_code != current['file']:
+                if store is not None and current['thread'] is not None:
+                    store.write_thread(current['thread'], current['referenced'])
+                current.update({'file': file_code, 'thread': None, 'referenced': set()})
+            event, chain = timeline_event(index, row, thread, args.inline_context)
+            current['referenced'].update(chain)
+            spiller.add(int(index.author[row]), event['timestamp'], int(row), json.dumps(event, ensure_ascii=False))
+        if store is not None:
+            if current['thread'] is not None:
+                store.write_thread(current['thread'], current['referenced'])
+            store.close()
+
+        # 4. k-way merge each user's runs into one JSONL file
+        for code in top_codes:
+            user = index.authors[code]
+            out_path = os.path.join(args.outdir, f"{user}_full_timeline.jsonl")
+            with open(out_path, 'w', encoding='utf-8') as f:
+                for line in spiller.merged(int(code)):
+                    f.write(line + '\n')
+            print(f"Saved full timeline for {user} to {out_path}")
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Time and memory-profile the corpus scripts on synthetic corpora.
+
+For each size, generates (or reuses) a synthetic corpus with
+synthetic_corpus.py, then runs every benchmarked script in a fresh process
+pointed at it through the REDDIT_EDA_* directory overrides. Each step is
+timed (wall clock, user and system CPU) and its peak resident memory taken
+from the child's rusage. The first step builds the event index cold; the
+report scripts then run against it warm.
+
+    python reddit_eda/scripts/benchmark_scans.py --sizes 10000 100000 1000000
+    python reddit_eda/scripts/benchmark_scans.py --sizes 10000 --compare old_report.json
+
+Results go to a JSON report (--output) that --compare can diff against a
+previous run to catch regressions.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import subprocess
+from synthetic_corpus import CorpusConfig, generate_corpus
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# (step name, script, extra arguments)
+STEPS = [
+    ('index_build', 'corpus_index.py', ['--rebuild']),
+    ('index_update', 'corpus_index.py', []),
+    ('top_users_bar_graph', 'top_users_bar_graph.py', []),
+    ('top_15_users_timeseries', 'top_15_users_timeseries.py', []),
+    ('top_15_users_by_posts_timeseries', 'top_15_users_by_posts_timeseries.py', []),
+    ('top_15_users_monthly_aggregation', 'top_15_users_monthly_aggregation.py', []),
+    ('report_engine', 'report_engine.py', []),
+    ('aggregate_top_users_full_timelines', 'aggregate_top_users_full_timelines.py', []),
+    ('isolate_high_density_segments', 'isolate_high_density_segments.py', []),
+]
+OPTIONAL_STEPS = [
+    # Needs the NLTK punkt and cmudict data
+    ('semantic_richness_timeseries', 'semantic_richness_timeseries.py', ['--top_n', '100']),
+]
+
+
+def run_step(script, extra_args, env, log_path):
+    """Run one script to completion; returns its timing and peak RSS."""
+    argv = [sys.executable, os.path.join(SCRIPTS_DIR, script)] + extra_args
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        # fork/exec rather than subprocess, so wait4 reaps the child itself and
+        # returns its own rusage (RUSAGE_CHILDREN's ru_maxrss is a maximum
+        # over all children, not this one's)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.chdir(SCRIPTS_DIR)
+                os.dup2(log.fileno(), 1)
+                os.dup2(log.fileno(), 2)
+                os.execve(sys.executable, argv, env)
+            finally:
+                os._exit(127)
+        _, status, usage = os.wait4(pid, 0)
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': round(seconds, 3),
+        'user_seconds': round(usage.ru_utime, 3),
+        'system_seconds': round(usage.ru_stime, 3),
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'max_rss_mb': round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'returncode': os.waitstatus_to_exitcode(status),
+    }
+
+
+def corpus_size(database_dir):
+    files, total = 0, 0
+    for root, _, names in os.walk(database_dir):
+        for name in names:
+            files += 1
+            total += os.path.getsize(os.path.join(root, name))
+    return files, total
+
+
+def prepare_corpus(workdir, config, workers=None):
+    """Generate the corpus for config unless an identical one is already in workdir."""
+    database_dir = os.path.join(workdir, f"corpus_{config.posts}", 'database')
+    marker = os.path.join(workdir, f"corpus_{config.posts}", 'config.json')
+    if os.path.exists(marker):
+        with open(marker, 'r') as f:
+            if json.load(f) == config.as_dict():
+                return database_dir
+        shutil.rmtree(database_dir, ignore_errors=True)
+    print(f"Generating {config.posts} synthetic posts in {database_dir}")
+    generate_corpus(database_dir, config, workers=workers)
+    with open(marker, 'w') as f:
+        json.dump(config.as_dict(), f)
+    return database_dir
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SCRIPTS_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print per-step time and memory ratios against a previous report."""
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['posts'], r['step']): r for r in json.load(f)['results']}
+    print(f"\n{'posts':>9} {'step':<36} {'seconds':>9} {'ratio':>7} {'rss_mb':>8} {'ratio':>7}")
+    for result in results:
+        old = baseline.get((result['posts'], result['step']))
+        time_ratio = f"{result['seconds'] / old['seconds']:.2f}" if old and old['seconds'] else '-'
+        rss_ratio = f"{result['max_rss_mb'] / old['max_rss_mb']:.2f}" if old and old['max_rss_mb'] else '-'
+        print(f"{result['posts']:>9} {result['step']:<36} {result['seconds']:>9.2f} {time_ratio:>7} "
+              f"{result['max_rss_mb']:>8.1f} {rss_ratio:>7}")
+
+
+def main():
+    step_names = [name for name, _, _ in STEPS + OPTIONAL_STEPS]
+    parser = argparse.ArgumentParser(description='Benchmark the corpus scripts on synthetic corpora')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Corpus sizes in posts')
+    parser.add_argument('--steps', nargs='+', default=None, help=f'Steps to run (default: all but optional); from {", ".join(step_names)}')
+    parser.add_argument('--workdir', default=os.path.join(SCRIPTS_DIR, '../benchmark/'), help='Where corpora, indexes and outputs go')
+    parser.add_argument('--output', default=None, help='JSON report path (default: <workdir>/benchmark_<timestamp>.json)')
+    parser.add_argument('--compare', default=None, help='Previous JSON report to compare against')
+    parser.add_argument('--comments_mean', type=float, default=8.0)
+    parser.add_argument('--max_depth', type=int, default=6)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--text_words', type=int, default=45)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--now', type=float, default=None,
+                        help='Reference epoch time of the corpus dates (default: start of today, UTC, so a '
+                             "corpus is reused within the day and stays inside the reports' lookback)")
+    parser.add_argument('--gen_workers', type=int, default=None, help='Corpus generator processes')
+    args = parser.parse_args()
+    unknown = [name for name in args.steps or [] if name not in step_names]
+    if unknown:
+        parser.error(f"unknown step(s): {', '.join(unknown)}")
+    steps = [step for step in STEPS + OPTIONAL_STEPS if step[0] in args.steps] if args.steps else STEPS
+
+    if args.now is None:
+        args.now = float(int(time.time()) // 86400 * 86400)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    configs = {}
+    for posts in args.sizes:
+        config = CorpusConfig(posts=posts, comments_mean=args.comments_mean, max_depth=args.max_depth,
+                              zipf=args.zipf, text_words=args.text_words, seed=args.seed, now=args.now)
+        configs[posts] = config.as_dict()
+        database_dir = prepare_corpus(args.workdir, config, workers=args.gen_workers)
+        n_files, n_bytes = corpus_size(database_dir)
+        run_dir = os.path.join(args.workdir, f"corpus_{posts}")
+        env = dict(os.environ, MPLBACKEND='Agg',
+                   REDDIT_EDA_DATABASE_DIR=database_dir,
+                   REDDIT_EDA_INDEX_DIR=os.path.join(run_dir, 'index'),
+                   REDDIT_EDA_ANALYSIS_DIR=os.path.join(run_dir, 'analysis'))
+        for name, script, extra_args in steps:
+            log_path = os.path.join(run_dir, f"{name}.log")
+            result = run_step(script, extra_args, env, log_path)
+            result.update({'posts': posts, 'files': n_files, 'corpus_bytes': n_bytes, 'step': name})
+            results.append(result)
+            status = 'ok' if result['returncode'] == 0 else f"FAILED (see {log_path})"
+            print(f"{posts:>9} {name:<36} {result['seconds']:>9.2f}s {result['max_rss_mb']:>8.1f} MB  {status}")
+
+    report = {
+        'created': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'git_revision': git_revision(),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'corpus_configs': configs,
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        args.workdir, f"benchmark_{datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved benchmark report to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
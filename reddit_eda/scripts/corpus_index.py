@@ -0,0 +1,548 @@
+"""Columnar event index over the scraped subreddit corpus.
+
+Parses every post under reddit_eda/database/<subreddit>/ (per-post JSON files
+or compressed shards, see post_store.py) once and stores
+one row per post/comment as NumPy columns under reddit_eda/index/. Text bodies
+and titles are kept in separate append-only UTF-8 blobs addressed by byte
+spans, so the numeric columns stay small enough to load whole. The report
+scripts in this directory query the index instead of re-parsing the corpus.
+
+A manifest records a stamp ((size, mtime) of a file, or the shard position of
+a sharded post) and sha1 for every ingested post. Updating the index only
+parses posts that are new or whose content changed, and the
+per-author aggregates stored next to the columns are adjusted by the rows that
+were dropped and added rather than recomputed.
+
+Update (or rebuild) the index with:
+    python reddit_eda/scripts/corpus_index.py [--rebuild]
+"""
+import os
+import json
+import mmap
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from time_buckets import bucket
+from post_store import iter_database, read_post_bytes
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Overridable from the environment, e.g. to run the scripts on a synthetic corpus
+DATABASE_DIR = os.environ.get('REDDIT_EDA_DATABASE_DIR', os.path.join(os.path.dirname(__file__), '../database/'))
+INDEX_DIR = os.environ.get('REDDIT_EDA_INDEX_DIR', os.path.join(os.path.dirname(__file__), '../index/'))
+ANALYSIS_DIR = os.environ.get('REDDIT_EDA_ANALYSIS_DIR', os.path.join(os.path.dirname(__file__), '../analysis/'))
+SUBREDDITS = ["AnorexiaNervosa", "ARFID", "bulimia", "EatingDisorders", "fuckeatingdisorders"]
+IGNORE_USERS = {"AutoModerator", "EDPostRequests", "AnorexiaNervosa-ModTeam", "fuckeatingdisorders-ModTeam"}
+
+INDEX_VERSION = 3
+POST, COMMENT = 0, 1
+EVENT_TYPES = ('post', 'comment')
+
+# Columns stored as <name>.npy; string ids use '' for "missing".
+NUMERIC_COLUMNS = {
+    'author': np.int32,        # code into meta['authors']
+    'subreddit': np.int16,     # code into meta['subreddits']
+    'type': np.int8,           # POST or COMMENT
+    'created_utc': np.float64, # 0.0 when missing
+    'text_len': np.int32,      # len(text) in characters
+    'word_count': np.int32,    # len(text.split())
+    'file': np.int32,          # code into meta['files'] (one per post)
+}
+STRING_COLUMNS = ('post_id', 'comment_id', 'parent_id', 'link_id')
+BLOBS = ('text', 'title')
+
+# Monthly aggregate rows are keyed by (author << 21) | (month << 1) | type,
+# where month counts calendar months since 1970-01.
+MONTHLY_STATS = ('count', 'words', 'chars', 'n_texts')
+
+# Smallest number of posts handed to one pool task.
+MIN_CHUNK_FILES = 64
+
+
+def iter_post_files(base_dir=DATABASE_DIR, subreddits=SUBREDDITS):
+    """Yield (subreddit, rel, source) for every post in a stable order.
+
+    rel is '<subreddit>/<post id>.json' whichever layout the post is stored
+    in, so converting a database to shards keeps its manifest keys; source is
+    what read_post_events takes. The keys match but the sha1s do not (a shard
+    stores compact JSON, a file indented JSON), so the first update after a
+    conversion reparses every converted post once.
+    """
+    for subreddit, post_id, source in iter_database(base_dir, subreddits):
+        yield subreddit, f"{subreddit}/{post_id}.json", source
+
+
+def read_post_events(source, handles=None):
+    """Parse one post (a file path or a shard ref) into event tuples.
+
+    Each tuple is (type, author, created_utc, post_id, comment_id, parent_id,
+    link_id, text, title), with the post itself first and its comments in file
+    order.
+    """
+    raw = read_post_bytes(source, handles)
+    data = None
+    if ORJSON_AVAILABLE:
+        try:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # e.g. lone surrogate escapes, which json accepts
+    if data is None:
+        data = json.loads(raw)
+    post_id = data.get('id') or ''
+    events = [(
+        POST,
+        data.get('author') or '',
+        data.get('created_utc') or 0.0,
+        post_id, '', '', '',
+        data.get('selftext') or '',
+        data.get('title') or '',
+    )]
+    for comment in data.get('comments', []):
+        events.append((
+            COMMENT,
+            comment.get('author') or '',
+            comment.get('created_utc') or 0.0,
+            post_id,
+            comment.get('id') or '',
+            comment.get('parent_id') or '',
+            comment.get('link_id') or '',
+            comment.get('body') or '',
+            '',
+        ))
+    return events
+
+
+def post_stamp(source):
+    """Cheap change marker of a post: (size, mtime) of its file, or its shard position."""
+    if isinstance(source, str):
+        st = os.stat(source)
+        return [st.st_size, st.st_mtime]
+    return [os.path.basename(source[0]), source[1], source[2]]
+
+
+def post_sha1(source):
+    if not isinstance(source, str):
+        return source[3]  # recorded by the store when the post was written
+    return file_sha1(source)
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Blob:
+    """Read-only view over a UTF-8 blob addressed by per-row (start, end) spans."""
+
+    def __init__(self, path, spans):
+        self.spans = spans
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __getitem__(self, row):
+        start, end = self.spans[row]
+        return self._data[start:end].decode('utf-8')
+
+
+def _load_column(path, n_events):
+    # np.load cannot memory-map a zero-length array
+    return np.load(path, mmap_mode='r' if n_events else None)
+
+
+def month_index(created_utc):
+    """Calendar months since 1970-01 for an array of epoch seconds."""
+    return bucket(created_utc, 'M').astype(np.int64)
+
+
+class EventIndex:
+    """Loaded event index: one attribute per column plus text/title lookup.
+
+    ``total_counts[code]`` is the number of events by each author and
+    ``monthly`` holds per-(author, month, type) counts and text statistics for
+    events with a timestamp; both are kept current by ``update_index``.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.authors = meta['authors']
+        self.subreddits = meta['subreddits']
+        self.files = meta['files']
+        self.n_events = meta['n_events']
+        self._author_codes = {a: i for i, a in enumerate(self.authors)}
+        for name in list(NUMERIC_COLUMNS) + list(STRING_COLUMNS):
+            setattr(self, name, _load_column(os.path.join(index_dir, f'{name}.npy'), self.n_events))
+        self._texts = _Blob(os.path.join(index_dir, 'text.bin'), np.load(os.path.join(index_dir, 'text_spans.npy')))
+        self._titles = _Blob(os.path.join(index_dir, 'title.bin'), np.load(os.path.join(index_dir, 'title_spans.npy')))
+        with np.load(os.path.join(index_dir, 'aggregates.npz')) as agg:
+            self.total_counts = agg['total_counts']
+            key = agg['monthly_key']
+            self.monthly = {
+                'author': key >> 21,
+                'month': ((key >> 1) & 0xFFFFF).astype('datetime64[M]'),
+                'type': key & 1,
+            }
+            for stat in MONTHLY_STATS:
+                self.monthly[stat] = agg[f'monthly_{stat}']
+        self._file_order = None
+
+    def __len__(self):
+        return self.n_events
+
+    def text(self, row):
+        return self._texts[row]
+
+    def title(self, row):
+        return self._titles[row]
+
+    def author_code(self, author):
+        return self._author_codes.get(author, -1)
+
+    def valid_authors(self, ignore_users=IGNORE_USERS):
+        """Boolean per author code: a real, non-ignored user."""
+        return np.array([bool(a) and a != 'None' and a not in ignore_users for a in self.authors], dtype=bool)
+
+    def author_mask(self, ignore_users=IGNORE_USERS):
+        """Rows whose author is a real, non-ignored user."""
+        keep = self.valid_authors(ignore_users)
+        return keep[self.author] if len(keep) else np.zeros(self.n_events, dtype=bool)
+
+    def rows_for_author(self, author):
+        return np.flatnonzero(self.author == self.author_code(author))
+
+    def file_rows(self, file_code):
+        """Rows parsed from one post, in file order."""
+        if self._file_order is None:
+            self._file_order = np.argsort(self.file, kind='stable')
+            self._file_starts = np.searchsorted(self.file, np.arange(len(self.files) + 1), sorter=self._file_order)
+        return self._file_order[self._file_starts[file_code]:self._file_starts[file_code + 1]]
+
+
+def _empty_columns():
+    columns = {name: np.array([], dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+    columns.update({name: np.array([], dtype=str) for name in STRING_COLUMNS})
+    columns.update({f'{blob}_spans': np.zeros((0, 2), dtype=np.int64) for blob in BLOBS})
+    return columns
+
+
+def _empty_aggregates():
+    agg = {'total_counts': np.array([], dtype=np.int64), 'monthly_key': np.array([], dtype=np.int64)}
+    agg.update({f'monthly_{stat}': np.array([], dtype=np.int64) for stat in MONTHLY_STATS})
+    return agg
+
+
+def _read_state(index_dir):
+    """Current (meta, manifest, columns, aggregates), or None if there is no usable index."""
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != INDEX_VERSION:
+        return None
+    with open(os.path.join(index_dir, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    columns = {name: np.load(os.path.join(index_dir, f'{name}.npy'))
+               for name in list(NUMERIC_COLUMNS) + list(STRING_COLUMNS)}
+    for blob in BLOBS:
+        columns[f'{blob}_spans'] = np.load(os.path.join(index_dir, f'{blob}_spans.npy'))
+    with np.load(os.path.join(index_dir, 'aggregates.npz')) as agg:
+        aggregates = {name: agg[name] for name in agg.files}
+    return meta, manifest, columns, aggregates
+
+
+def _parse_chunk(targets):
+    """Parse (file_code, subreddit_code, source) targets into a partial column set.
+
+    Runs in pool workers, so authors are coded against a chunk-local table and
+    texts/titles come back as one encoded byte string per blob.
+    """
+    authors = {}
+    rows = {name: [] for name in list(NUMERIC_COLUMNS) + list(STRING_COLUMNS)}
+    parts = {blob: [] for blob in BLOBS}
+    handles = {}  # shard files kept open across the chunk
+    for file_code, subreddit_code, source in targets:
+        for etype, author, created_utc, post_id, comment_id, parent_id, link_id, text, title in read_post_events(source, handles):
+            rows['author'].append(authors.setdefault(author, len(authors)))
+            rows['subreddit'].append(subreddit_code)
+            rows['type'].append(etype)
+            rows['created_utc'].append(created_utc)
+            rows['text_len'].append(len(text))
+            rows['word_count'].append(len(text.split()))
+            rows['file'].append(file_code)
+            rows['post_id'].append(post_id)
+            rows['comment_id'].append(comment_id)
+            rows['parent_id'].append(parent_id)
+            rows['link_id'].append(link_id)
+            parts['text'].append(text.encode('utf-8'))
+            parts['title'].append(title.encode('utf-8'))
+    for f in handles.values():
+        f.close()
+
+    partial = {name: np.array(rows[name], dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+    partial.update({name: np.array(rows[name], dtype=str) for name in STRING_COLUMNS})
+    for blob in BLOBS:
+        partial[f'{blob}_bytes'] = b''.join(parts[blob])
+        partial[f'{blob}_nbytes'] = np.array([len(p) for p in parts[blob]], dtype=np.int64)
+    partial['authors'] = list(authors)
+    return partial
+
+
+def _pool_context():
+    # Report scripts run at module level without a __main__ guard, so spawned
+    # workers would re-run them; only parallelise where fork is available.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def _parse_files(targets, author_codes, index_dir, workers=None):
+    """Parse (file_code, subreddit_code, source) targets into new index columns.
+
+    Files are split into chunks parsed across a process pool; the partial
+    columns are merged in chunk order, so the result is identical to a serial
+    parse. Texts and titles are appended to the blobs and author_codes is
+    extended in place with any authors not seen before.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(MIN_CHUNK_FILES, len(targets) // (workers * 4) + 1)
+    chunks = [targets[i:i + chunk_size] for i in range(0, len(targets), chunk_size)]
+    context = _pool_context()
+    pool = None
+    if workers > 1 and len(chunks) > 1 and context is not None:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context)
+        partials = pool.map(_parse_chunk, chunks)
+    else:
+        partials = map(_parse_chunk, chunks)
+
+    merged = []
+    blobs = {blob: open(os.path.join(index_dir, f'{blob}.bin'), 'ab') for blob in BLOBS}
+    try:
+        for partial in partials:
+            remap = np.array([author_codes.setdefault(a, len(author_codes)) for a in partial.pop('authors')],
+                             dtype=np.int32)
+            partial['author'] = remap[partial['author']] if len(remap) else partial['author']
+            for blob in BLOBS:
+                offset = blobs[blob].tell()
+                blobs[blob].write(partial.pop(f'{blob}_bytes'))
+                nbytes = partial.pop(f'{blob}_nbytes')
+                ends = offset + np.cumsum(nbytes)
+                partial[f'{blob}_spans'] = np.stack([ends - nbytes, ends], axis=1)
+            merged.append(partial)
+    finally:
+        for f in blobs.values():
+            f.close()
+        if pool is not None:
+            pool.shutdown()
+
+    if not merged:
+        return _empty_columns()
+    return {name: np.concatenate([partial[name] for partial in merged]) for name in merged[0]}
+
+
+def _monthly_delta(columns, sign):
+    """Per-(author, month, type) statistics contributed by a set of rows."""
+    timed = columns['created_utc'] > 0
+    author = columns['author'][timed].astype(np.int64)
+    key = (author << 21) | (month_index(columns['created_utc'][timed]) << 1) | columns['type'][timed].astype(np.int64)
+    has_text = columns['text_len'][timed] > 0
+    stats = {
+        'count': np.ones(len(key), dtype=np.int64),
+        'words': np.where(has_text, columns['word_count'][timed], 0).astype(np.int64),
+        'chars': columns['text_len'][timed].astype(np.int64),
+        'n_texts': has_text.astype(np.int64),
+    }
+    return key, {stat: sign * values for stat, values in stats.items()}
+
+
+def _apply_delta(aggregates, columns, sign, n_authors):
+    """Add (sign=1) or subtract (sign=-1) the contribution of some rows."""
+    total = np.zeros(n_authors, dtype=np.int64)
+    total[:len(aggregates['total_counts'])] = aggregates['total_counts']
+    total += sign * np.bincount(columns['author'], minlength=n_authors).astype(np.int64)
+
+    key, stats = _monthly_delta(columns, sign)
+    all_keys = np.concatenate([aggregates['monthly_key'], key])
+    uniq, inverse = np.unique(all_keys, return_inverse=True)
+    merged = {}
+    for stat in MONTHLY_STATS:
+        merged[stat] = np.bincount(inverse, weights=np.concatenate([aggregates[f'monthly_{stat}'], stats[stat]]),
+                                   minlength=len(uniq)).astype(np.int64)
+    live = merged['count'] != 0
+
+    result = {'total_counts': total, 'monthly_key': uniq[live]}
+    result.update({f'monthly_{stat}': merged[stat][live] for stat in MONTHLY_STATS})
+    return result
+
+
+def _compact_blobs(index_dir, columns):
+    """Rewrite the text/title blobs without bytes from dropped rows."""
+    for blob in BLOBS:
+        path = os.path.join(index_dir, f'{blob}.bin')
+        spans = columns[f'{blob}_spans']
+        new_spans = np.zeros_like(spans)
+        with open(path, 'rb') as src, open(path + '.tmp', 'wb') as dst:
+            offset = 0
+            for i, (start, end) in enumerate(spans):
+                src.seek(start)
+                dst.write(src.read(end - start))
+                new_spans[i] = (offset, offset + end - start)
+                offset += end - start
+        os.replace(path + '.tmp', path)
+        columns[f'{blob}_spans'] = new_spans
+
+
+def update_index(base_dir=DATABASE_DIR, index_dir=INDEX_DIR, subreddits=SUBREDDITS, rebuild=False, workers=None):
+    """Bring the index in line with the posts on disk.
+
+    Only new or changed posts (by stamp, confirmed by sha1) are parsed; rows
+    from changed or deleted posts are dropped. Parsing uses up to
+    `workers` processes (default: all cores). Returns a summary dict.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    meta_path = os.path.join(index_dir, 'meta.json')
+    state = None if rebuild else _read_state(index_dir)
+    if state is None:
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for blob in BLOBS:
+            open(os.path.join(index_dir, f'{blob}.bin'), 'wb').close()
+        meta = {'version': INDEX_VERSION, 'n_events': 0, 'authors': [], 'subreddits': list(subreddits),
+                'files': [], 'garbage_bytes': 0}
+        manifest, columns, aggregates = {}, _empty_columns(), _empty_aggregates()
+    else:
+        meta, manifest, columns, aggregates = state
+
+    subreddit_codes = {s: i for i, s in enumerate(meta['subreddits'])}
+    for s in subreddits:
+        if s not in subreddit_codes:
+            subreddit_codes[s] = len(meta['subreddits'])
+            meta['subreddits'].append(s)
+
+    on_disk = {}
+    targets, manifest_dirty = [], False
+    for subreddit, rel, source in iter_post_files(base_dir, subreddits):
+        on_disk[rel] = True
+        stamp = post_stamp(source)
+        entry = manifest.get(rel)
+        if entry and entry['stamp'] == stamp:
+            continue
+        digest = post_sha1(source)
+        if entry and entry['sha1'] == digest:
+            entry['stamp'] = stamp  # touched or moved but unchanged
+            manifest_dirty = True
+            continue
+        if entry:
+            file_code = entry['code']
+        else:
+            file_code = len(meta['files'])
+            meta['files'].append(rel)
+        manifest[rel] = {'stamp': stamp, 'sha1': digest, 'code': file_code}
+        targets.append((file_code, subreddit_codes[subreddit], source))
+    removed = [rel for rel in manifest if rel not in on_disk]
+
+    summary = {'parsed': len(targets), 'removed': len(removed), 'n_events': meta['n_events']}
+    if state is not None and not targets and not removed:
+        if manifest_dirty:
+            with open(os.path.join(index_dir, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f)
+        return summary
+
+    # meta.json marks a complete index; drop it while rewriting
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    stale_codes = [code for code, _, _ in targets] + [manifest[rel]['code'] for rel in removed]
+    for rel in removed:
+        meta['files'][manifest.pop(rel)['code']] = None
+    stale = np.isin(columns['file'], stale_codes)
+    if stale.any():
+        dropped = {name: values[stale] for name, values in columns.items()}
+        aggregates = _apply_delta(aggregates, dropped, -1, len(meta['authors']))
+        meta['garbage_bytes'] += int(sum((dropped[f'{blob}_spans'][:, 1] - dropped[f'{blob}_spans'][:, 0]).sum()
+                                         for blob in BLOBS))
+        columns = {name: values[~stale] for name, values in columns.items()}
+
+    author_codes = {a: i for i, a in enumerate(meta['authors'])}
+    added = _parse_files(targets, author_codes, index_dir, workers)
+    meta['authors'] = list(author_codes)
+    aggregates = _apply_delta(aggregates, added, 1, len(meta['authors']))
+    columns = {name: np.concatenate([columns[name], added[name]]) for name in columns}
+
+    live_bytes = sum(int((columns[f'{blob}_spans'][:, 1] - columns[f'{blob}_spans'][:, 0]).sum()) for blob in BLOBS)
+    if meta['garbage_bytes'] > live_bytes:
+        _compact_blobs(index_dir, columns)
+        meta['garbage_bytes'] = 0
+
+    for name, values in columns.items():
+        np.save(os.path.join(index_dir, f'{name}.npy'), values)
+    np.savez(os.path.join(index_dir, 'aggregates.npz'), **aggregates)
+    with open(os.path.join(index_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    meta['n_events'] = len(columns['author'])
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+    summary['n_events'] = meta['n_events']
+    return summary
+
+
+def build_index(base_dir=DATABASE_DIR, index_dir=INDEX_DIR, subreddits=SUBREDDITS, workers=None):
+    """Parse the whole corpus from scratch into index_dir."""
+    return update_index(base_dir, index_dir, subreddits, rebuild=True, workers=workers)
+
+
+def load_or_build_index(index_dir=INDEX_DIR, base_dir=DATABASE_DIR, subreddits=SUBREDDITS, rebuild=False, workers=None):
+    """Update the index from the posts on disk and load it."""
+    summary = update_index(base_dir, index_dir, subreddits, rebuild=rebuild, workers=workers)
+    if summary['parsed'] or summary['removed']:
+        print(f"Event index: parsed {summary['parsed']} new/changed posts, "
+              f"dropped {summary['removed']} deleted ones ({summary['n_events']} events)")
+    return EventIndex(index_dir)
+
+
+def most_common(codes, n=None):
+    """Counter(codes).most_common(n) for an integer code array.
+
+    Returns (codes, counts) arrays; ties keep first-seen order like Counter.
+    """
+    if len(codes) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    uniq, first, counts = np.unique(codes, return_index=True, return_counts=True)
+    order = np.lexsort((first, -counts))[:n]
+    return uniq[order], counts[order]
+
+
+def top_counts(counts, n=None):
+    """Like most_common, for a per-code count array (ties go to the lower code)."""
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] > 0][:n]
+    return order, counts[order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or incrementally update the columnar event index')
+    parser.add_argument('--database_dir', default=DATABASE_DIR, help='Directory with <subreddit>/<post_id>.json files or post shards')
+    parser.add_argument('--index_dir', default=INDEX_DIR, help='Directory holding the index')
+    parser.add_argument('--rebuild', action='store_true', help='Discard the existing index and parse every file')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: all cores; 1 = serial)')
+    args = parser.parse_args()
+
+    summary = update_index(args.database_dir, args.index_dir, rebuild=args.rebuild, workers=args.workers)
+    print(f"Parsed {summary['parsed']} new/changed posts, dropped {summary['removed']} deleted ones; "
+          f"index now holds {summary['n_events']} events in {args.index_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Sliding-window activity density for every user in the event index.
+
+daily_activity() turns the index into dense per-day frequency and character
+arrays for each author, laid end to end (author i owns
+[offsets[i], offsets[i+1]) covering first_day[i] .. its last active day).
+Window totals then come from one cumulative sum per statistic, so scoring
+every window of every user is O(total days) per window size, and
+top_windows() picks the k best non-overlapping windows of a user off a heap.
+
+    activity = daily_activity(index)
+    for segment in density_segments(activity, window_sizes=(7, 30), top_k=5):
+        ...
+"""
+import heapq
+import bisect
+import numpy as np
+from corpus_index import IGNORE_USERS
+from time_buckets import bucket
+
+
+class DailyActivity:
+    """Dense daily activity of a set of authors, stored back to back."""
+
+    def __init__(self, authors, first_day, offsets, freq, chars, rows, row_days, row_offsets):
+        self.authors = authors          # author codes, ascending
+        self.first_day = first_day      # int64 days since 1970-01-01
+        self.offsets = offsets          # len(authors) + 1
+        self.freq = freq                # posts + comments per day
+        self.chars = chars              # text characters per day
+        self.rows = rows                # index rows grouped by author, then day (row order within a day)
+        self.row_days = row_days
+        self.row_offsets = row_offsets  # len(authors) + 1, into rows
+
+    def __len__(self):
+        return len(self.authors)
+
+    def window_rows(self, i, start_day, end_day):
+        """Index rows of author i from start_day to end_day inclusive, in day order."""
+        lo, hi = self.row_offsets[i], self.row_offsets[i + 1]
+        days = self.row_days[lo:hi]
+        return self.rows[lo + np.searchsorted(days, start_day):lo + np.searchsorted(days, end_day, side='right')]
+
+
+def daily_activity(index, users=None, min_events=1, ignore=IGNORE_USERS):
+    """Per-day activity arrays for the given user names (default: every author)."""
+    keep = (index.created_utc > 0) & index.author_mask(ignore)
+    if users is not None:
+        codes = [index.author_code(user) for user in users]
+        wanted = np.zeros(len(index.authors), dtype=bool)
+        wanted[[code for code in codes if code >= 0]] = True
+        keep &= wanted[index.author]
+    rows = np.flatnonzero(keep)
+    authors = np.asarray(index.author[rows]).astype(np.int64)
+    if min_events > 1:
+        busy = np.bincount(authors, minlength=len(index.authors)) >= min_events
+        rows, authors = rows[busy[authors]], authors[busy[authors]]
+    days = bucket(index.created_utc[rows], 'D').astype(np.int64)
+    chars = np.asarray(index.text_len[rows]).astype(np.int64)
+
+    # Group by author, then day; lexsort is stable so rows stay in index order within a day
+    order = np.lexsort((days, authors))
+    rows, authors, days, chars = rows[order], authors[order], days[order], chars[order]
+
+    new_group = np.ones(len(rows), dtype=bool)
+    new_group[1:] = (authors[1:] != authors[:-1]) | (days[1:] != days[:-1])
+    group_starts = np.flatnonzero(new_group)
+    group_author, group_day = authors[group_starts], days[group_starts]
+    group_freq = np.diff(np.append(group_starts, len(rows)))
+    group_chars = np.add.reduceat(chars, group_starts) if len(rows) else chars
+
+    user_codes, user_group_start, user_groups = np.unique(group_author, return_index=True, return_counts=True)
+    first_day = group_day[user_group_start]
+    last_day = group_day[user_group_start + user_groups - 1]
+    offsets = np.concatenate([[0], np.cumsum(last_day - first_day + 1)]).astype(np.int64)
+
+    user_of_group = np.repeat(np.arange(len(user_codes)), user_groups)
+    position = offsets[user_of_group] + group_day - first_day[user_of_group]
+    freq = np.zeros(offsets[-1], dtype=np.int64)
+    dense_chars = np.zeros(offsets[-1], dtype=np.int64)
+    freq[position] = group_freq
+    dense_chars[position] = group_chars
+
+    row_offsets = np.searchsorted(authors, np.append(user_codes, np.iinfo(np.int64).max))
+    return DailyActivity(user_codes, first_day, offsets, freq, dense_chars, rows, days, row_offsets)
+
+
+def window_sums(activity, values, window_size):
+    """Totals of values over the window starting at every valid position.
+
+    Returns (sums, valid): a user whose active span is at least window_size
+    gets a window at every start whose end stays within the span; a shorter
+    user gets a single window starting on their first active day.
+    """
+    n = len(values)
+    cumulative = np.concatenate([[0], np.cumsum(values)])
+    ends = np.minimum(np.arange(n) + window_size, n)
+    sums = cumulative[ends] - cumulative[:-1]
+
+    spans = np.diff(activity.offsets)
+    owner = np.repeat(np.arange(len(activity)), spans)
+    local = np.arange(n) - activity.offsets[owner]
+    valid = (local <= spans[owner] - window_size) | ((spans[owner] < window_size) & (local == 0))
+    # Short users' single window holds all of their activity
+    short = np.flatnonzero((spans < window_size) & (spans > 0))
+    sums[activity.offsets[short]] = cumulative[activity.offsets[short + 1]] - cumulative[activity.offsets[short]]
+    return sums, valid
+
+
+def top_windows(starts, scores, window_size, k):
+    """Starts of the k highest-scoring pairwise non-overlapping windows.
+
+    Ties go to the earlier start. Greedy: pop windows best first off a heap and
+    keep each one that does not overlap a window already kept.
+    """
+    heap = list(zip((-scores).tolist(), starts.tolist()))
+    heapq.heapify(heap)
+    chosen = []
+    taken = []  # sorted starts of chosen windows
+    while heap and len(chosen) < k:
+        _, start = heapq.heappop(heap)
+        i = bisect.bisect_left(taken, start)
+        if (i > 0 and start - taken[i - 1] < window_size) or (i < len(taken) and taken[i] - start < window_size):
+            continue
+        taken.insert(i, start)
+        chosen.append(start)
+    return chosen
+
+
+def density_segments(activity, window_sizes=(30,), top_k=5):
+    """Yield the top_k richest (by characters) non-overlapping windows per user and size.
+
+    Each segment is a dict with author (code), window_size, rank, start_day and
+    end_day (datetime64[D]), total_freq, total_chars and the position of the
+    user in activity (user_index).
+    """
+    scored = {}
+    for window_size in window_sizes:
+        chars, valid = window_sums(activity, activity.chars, window_size)
+        freq, _ = window_sums(activity, activity.freq, window_size)
+        scored[window_size] = (chars, freq, valid & (freq > 0))
+
+    for i, author in enumerate(activity.authors):
+        lo, hi = activity.offsets[i], activity.offsets[i + 1]
+        for window_size in window_sizes:
+            chars, freq, valid = scored[window_size]
+            starts = np.flatnonzero(valid[lo:hi])
+            picked = top_windows(starts, chars[lo:hi][starts], window_size, top_k)
+            for rank, start in enumerate(picked, 1):
+                start_day = np.datetime64(int(activity.first_day[i] + start), 'D')
+                yield {
+                    'user_index': i,
+                    'author': int(author),
+                    'window_size': window_size,
+                    'rank': rank,
+                    'start_day': start_day,
+                    'end_day': start_day + window_size - 1,
+                    'total_freq': int(freq[lo + start]),
+                    'total_chars': int(chars[lo + start]),
+                }
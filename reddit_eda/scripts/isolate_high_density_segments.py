@@ -1,126 +1,34 @@
 import os
-import json
-from collections import defaultdict
-import datetime
 import csv
+import argparse
+import numpy as np
 import matplotlib.pyplot as plt
-from datetime import timedelta
+from corpus_index import ANALYSIS_DIR, load_or_build_index
+from density_engine import daily_activity, density_segments
 
-BASE_DIR = os.path.join(os.path.dirname(__file__), '../database/')
-ANALYSIS_DIR = os.path.join(os.path.dirname(__file__), '../analysis/')
-subreddits = ["AnorexiaNervosa", "ARFID", "bulimia", "EatingDisorders", "fuckeatingdisorders"]
-ignore_users = {"AutoModerator", "EDPostRequests", "AnorexiaNervosa-ModTeam", "fuckeatingdisorders-ModTeam"}
-TARGET_USER = "Sareeee48"
 
-# {date_str: [list of (text, type, subreddit, post_id, comment_id)]}
-user_daily_texts = defaultdict(list)
-
-for subreddit in subreddits:
-    sub_dir = os.path.join(BASE_DIR, subreddit)
-    if not os.path.isdir(sub_dir):
-        continue
-    for fname in os.listdir(sub_dir):
-        if not fname.endswith(".json"):
-            continue
-        with open(os.path.join(sub_dir, fname), "r") as f:
-            data = json.load(f)
-            # Post
-            author = data.get("author")
-            created_utc = data.get("created_utc")
-            if author == TARGET_USER and created_utc:
-                dt = datetime.datetime.utcfromtimestamp(created_utc)
-                date_str = dt.strftime("%Y-%m-%d")
-                text = data.get("selftext", "")
-                user_daily_texts[date_str].append((text, "post", subreddit, data.get("id"), None))
-            # Comments
-            for comment in data.get("comments", []):
-                c_author = comment.get("author")
-                c_created_utc = comment.get("created_utc")
-                if c_author == TARGET_USER and c_created_utc:
-                    dt = datetime.datetime.utcfromtimestamp(c_created_utc)
-                    date_str = dt.strftime("%Y-%m-%d")
-                    text = comment.get("body", "")
-                    user_daily_texts[date_str].append((text, "comment", subreddit, data.get("id"), comment.get("id")))
-
-# Analyze daily density
-results = []
-for date_str, entries in user_daily_texts.items():
-    freq = len(entries)
-    total_chars = sum(len(e[0]) for e in entries)
-    results.append({
-        "date": date_str,
-        "frequency": freq,
-        "total_chars": total_chars,
-        "entries": entries
-    })
-
-# Sort by date
-results.sort(key=lambda x: x["date"])
-
-# Find high-density stretches: at least 1 per day, allow up to 1 missed day, min 30 days
-all_dates = sorted(user_daily_texts.keys())
-if all_dates:
-    min_date = min(all_dates)
-    max_date = max(all_dates)
-    date_range = [(datetime.datetime.strptime(min_date, "%Y-%m-%d") + timedelta(days=i)).strftime("%Y-%m-%d")
-                  for i in range((datetime.datetime.strptime(max_date, "%Y-%m-%d") - datetime.datetime.strptime(min_date, "%Y-%m-%d")).days + 1)]
-else:
-    date_range = []
-
-# Find the most rich 30-day stretches (sliding window, no gap requirement)
-window_size = 30
-richest_windows = []
-if date_range:
-    # Build a lookup for date_str -> day data
-    day_lookup = {d["date"]: d for d in results}
-    for i in range(len(date_range) - window_size + 1):
-        window_dates = date_range[i:i+window_size]
-        window_days = [day_lookup.get(ds, {"date": ds, "frequency": 0, "total_chars": 0, "entries": []}) for ds in window_dates]
-        total_chars = sum(day["total_chars"] for day in window_days)
-        total_freq = sum(day["frequency"] for day in window_days)
-        richest_windows.append({
-            "start_date": window_dates[0],
-            "end_date": window_dates[-1],
-            "days": window_days,
-            "total_chars": total_chars,
-            "total_freq": total_freq
-        })
-    # Sort by total_chars (richness)
-    richest_windows.sort(key=lambda w: w["total_chars"], reverse=True)
-
-# Output top 5 stretches to CSV
-os.makedirs(ANALYSIS_DIR, exist_ok=True)
-csv_path = os.path.join(ANALYSIS_DIR, f"Sareeee48_high_density_segments.csv")
-with open(csv_path, "w", newline='', encoding="utf-8") as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(["window_rank", "start_date", "end_date", "days", "total_posts_comments", "total_chars", "sample_texts"])
-    for i, window in enumerate(richest_windows[:5]):
-        start_date = window["start_date"]
-        end_date = window["end_date"]
-        days = window_size
-        total_posts_comments = window["total_freq"]
-        total_chars = window["total_chars"]
-        # Sample up to 3 texts from the window
-        sample_texts = []
-        for day in window["days"]:
-            for entry in day["entries"]:
-                if entry[0]:
-                    sample_texts.append(entry[0][:200].replace("\n", " "))
-                if len(sample_texts) >= 3:
-                    break
-            if len(sample_texts) >= 3:
+def sample_texts(index, rows, n=3):
+    """Up to n non-empty texts (first 200 chars) from rows, in order."""
+    samples = []
+    for row in rows:
+        if index.text_len[row]:
+            samples.append(index.text(row)[:200].replace("\n", " "))
+            if len(samples) >= n:
                 break
-        writer.writerow([i+1, start_date, end_date, days, total_posts_comments, total_chars, " | ".join(sample_texts)])
-print(f"Saved high-density segments for {TARGET_USER} to {csv_path}")
+    return samples
+
 
-# Visualization for the top 3 richest windows
-if richest_windows:
+def plot_windows(activity, user, i, windows, plot_path):
+    """Daily frequency and characters of a user's top windows, one panel each."""
     plt.figure(figsize=(18, 12))
-    for idx, window in enumerate(richest_windows[:3]):
-        dates = [day["date"] for day in window["days"]]
-        freqs = [day["frequency"] for day in window["days"]]
-        chars = [day["total_chars"] for day in window["days"]]
-        ax1 = plt.subplot(3, 1, idx+1)
+    for idx, window in enumerate(windows):
+        start = window['start_day'].astype(np.int64) - activity.first_day[i]
+        positions = activity.offsets[i] + start + np.arange(window['window_size'])
+        positions = positions[positions < activity.offsets[i + 1]]
+        dates = [str(window['start_day'] + k) for k in range(len(positions))]
+        freqs = activity.freq[positions]
+        chars = activity.chars[positions]
+        ax1 = plt.subplot(len(windows), 1, idx+1)
         ax1.bar(dates, freqs, color='tab:blue', alpha=0.6, label='Frequency (posts/comments)')
         ax1.set_ylabel('Frequency', color='tab:blue')
         ax1.tick_params(axis='y', labelcolor='tab:blue')
@@ -130,10 +38,53 @@ if richest_windows:
         ax2.plot(dates, chars, color='tab:red', marker='o', label='Total Chars')
         ax2.set_ylabel('Total Chars', color='tab:red')
         ax2.tick_params(axis='y', labelcolor='tab:red')
-        ax1.set_title(f"Window {idx+1}: {dates[0]} to {dates[-1]}")
+        ax1.set_title(f"{user} window {idx+1}: {dates[0]} to {dates[-1]}")
         ax1.legend(loc='upper left')
         ax2.legend(loc='upper right')
     plt.tight_layout()
-    plot_path = os.path.join(ANALYSIS_DIR, f"Sareeee48_high_density_stretches_plot.png")
     plt.savefig(plot_path)
-    print(f"Saved visualization to {plot_path}") 
\ No newline at end of file
+    plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the richest non-overlapping activity windows of every user')
+    parser.add_argument('--users', nargs='+', default=None, help='Only these users (default: all users)')
+    parser.add_argument('--window_sizes', type=int, nargs='+', default=[30], help='Window lengths in days')
+    parser.add_argument('--top_k', type=int, default=5, help='Windows to keep per user and window size')
+    parser.add_argument('--min_events', type=int, default=1, help='Skip users with fewer posts + comments')
+    parser.add_argument('--plot', action='store_true', help='Plot the top 3 windows of each user (use with --users)')
+    parser.add_argument('--outdir', default=ANALYSIS_DIR, help='Directory to save outputs')
+    args = parser.parse_args()
+
+    index = load_or_build_index()
+    activity = daily_activity(index, users=args.users, min_events=args.min_events)
+    print(f"Scoring {len(activity)} users over {len(activity.freq)} user-days")
+
+    os.makedirs(args.outdir, exist_ok=True)
+    csv_path = os.path.join(args.outdir, "high_density_segments.csv")
+    to_plot = {}
+    with open(csv_path, "w", newline='', encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["user", "window_rank", "start_date", "end_date", "days", "total_posts_comments", "total_chars", "sample_texts"])
+        for window in density_segments(activity, args.window_sizes, args.top_k):
+            user = index.authors[window['author']]
+            rows = activity.window_rows(window['user_index'], window['start_day'].astype(np.int64),
+                                        window['end_day'].astype(np.int64))
+            writer.writerow([
+                user, window['rank'], window['start_day'], window['end_day'], window['window_size'],
+                window['total_freq'], window['total_chars'], " | ".join(sample_texts(index, rows))
+            ])
+            if args.plot and window['rank'] <= 3:
+                to_plot.setdefault((user, window['window_size']), []).append(window)
+    print(f"Saved high-density segments to {csv_path}")
+
+    # Visualization for the top 3 richest windows of each user
+    for (user, window_size), windows in to_plot.items():
+        suffix = f"_{window_size}d" if len(args.window_sizes) > 1 else ""
+        plot_path = os.path.join(args.outdir, f"{user}{suffix}_high_density_stretches_plot.png")
+        plot_windows(activity, user, windows[0]['user_index'], windows, plot_path)
+        print(f"Saved visualization to {plot_path}")
+
+
+if __name__ == '__main__':
+    main()
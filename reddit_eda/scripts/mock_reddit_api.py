@@ -0,0 +1,290 @@
+"""Local stand-in for the Reddit API endpoints the scraper uses.
+
+Serves a corpus in either of the scraper's on-disk layouts (a scraped
+database or one written by synthetic_corpus.py) through the endpoints PRAW calls while
+scraping:
+
+    POST /api/v1/access_token     client-credentials token
+    GET  /r/<subreddit>/<listing> listing pages (limit/after); 'new' by date,
+                                  every other listing by score
+    GET  /comments/<id>/          submission plus the first --page_size top-level
+                                  comment threads; the rest behind "more" stubs
+    POST /api/morechildren/       the comments of a "more" stub
+    GET  /api/info/               submissions by fullname (id=t3_a,t3_b,...)
+
+Requests are counted against a Reddit-style budget of --budget requests per
+--window seconds, reported in the x-ratelimit-* headers and answered with 429
+plus Retry-After once it is spent. --latency adds a fixed delay per request.
+
+    python reddit_eda/scripts/mock_reddit_api.py /tmp/corpus --port 8765 --budget 300 --window 60
+    python reddit_eda/scripts/scrape_top_posts_and_comments.py --api_url http://127.0.0.1:8765 --database_dir /tmp/scraped
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from post_store import iter_database, read_post
+
+MORE_SIZE = 100  # comment ids per morechildren call, as on Reddit
+LISTINGS = ('top', 'hot', 'new', 'controversial', 'rising')
+
+
+def _author(name):
+    return '[deleted]' if name in (None, 'None') else name
+
+
+class MockCorpus:
+    """Posts of each subreddit, served as listings."""
+
+    def __init__(self, database_dir, page_size=20):
+        self.database_dir = database_dir
+        self.page_size = page_size
+        self.top = {}   # subreddit (lower case) -> [post id] by score descending
+        self.new = {}   # subreddit (lower case) -> [post id] newest first
+        self.sources = {}  # post id -> file path or shard ref
+        ranked, dated = {}, {}
+        subreddits = sorted(name for name in os.listdir(database_dir) if os.path.isdir(os.path.join(database_dir, name)))
+        for subreddit, post_id, source in iter_database(database_dir, subreddits):
+            post = read_post(source)
+            ranked.setdefault(subreddit.lower(), []).append((-(post.get('score') or 0), post_id))
+            dated.setdefault(subreddit.lower(), []).append((-(post.get('created_utc') or 0), post_id))
+            self.sources[post_id] = source
+        for subreddit in ranked:
+            self.top[subreddit] = [post_id for _, post_id in sorted(ranked[subreddit])]
+            self.new[subreddit] = [post_id for _, post_id in sorted(dated[subreddit])]
+
+    def post(self, post_id):
+        return read_post(self.sources[post_id])
+
+    @staticmethod
+    def parent_id(post, comment):
+        if comment.get('parent_id'):
+            return comment['parent_id']
+        if comment.get('context'):
+            return 't1_' + comment['context'][-1]['id']
+        return 't3_' + post['id']
+
+    def submission_data(self, post):
+        return {
+            'id': post['id'],
+            'name': 't3_' + post['id'],
+            'title': post['title'],
+            'selftext': post['selftext'],
+            'author': _author(post['author']),
+            'created_utc': post['created_utc'],
+            'subreddit': post['subreddit'],
+            'subreddit_name_prefixed': 'r/' + post['subreddit'],
+            'url': post['url'],
+            'permalink': f"/r/{post['subreddit']}/comments/{post['id']}/",
+            'score': post['score'],
+            'num_comments': post['num_comments'],
+        }
+
+    def comment_data(self, post, comment, depth, replies=''):
+        return {
+            'id': comment['id'],
+            'name': 't1_' + comment['id'],
+            'author': _author(comment['author']),
+            'body': comment['body'],
+            'created_utc': comment['created_utc'],
+            'score': comment['score'],
+            'parent_id': self.parent_id(post, comment),
+            'link_id': 't3_' + post['id'],
+            'subreddit': post['subreddit'],
+            'depth': depth,
+            'replies': replies,
+        }
+
+    def listing(self, subreddit, listing, limit, after):
+        ranked = (self.new if listing == 'new' else self.top).get(subreddit.lower(), [])
+        start = ranked.index(after[3:]) + 1 if after and after[3:] in ranked else 0
+        page = ranked[start:start + limit]
+        children = [{'kind': 't3', 'data': self.submission_data(self.post(post_id))} for post_id in page]
+        next_after = 't3_' + page[-1] if page and start + limit < len(ranked) else None
+        return _listing(children, after=next_after)
+
+    def info(self, fullnames):
+        children = [{'kind': 't3', 'data': self.submission_data(self.post(name[3:]))}
+                    for name in fullnames if name.startswith('t3_') and name[3:] in self.sources]
+        return _listing(children)
+
+    def _tree(self, post):
+        children = {}
+        for comment in post['comments']:
+            children.setdefault(self.parent_id(post, comment), []).append(comment)
+        return children
+
+    def comments(self, post_id):
+        post = self.post(post_id)
+        children = self._tree(post)
+
+        def nested(comment, depth):
+            replies = [nested(child, depth + 1) for child in children.get('t1_' + comment['id'], [])]
+            return {'kind': 't1', 'data': self.comment_data(post, comment, depth, _listing(replies) if replies else '')}
+
+        def subtree_ids(comment):
+            ids = [comment['id']]
+            for child in children.get('t1_' + comment['id'], []):
+                ids.extend(subtree_ids(child))
+            return ids
+
+        roots = children.get('t3_' + post_id, [])
+        things = [nested(comment, 0) for comment in roots[:self.page_size]]
+        # Remaining threads go behind "more" stubs, whole threads per stub so a
+        # reply never arrives before its parent
+        batch = []
+        for comment in roots[self.page_size:]:
+            ids = subtree_ids(comment)
+            if batch and len(batch) + len(ids) > MORE_SIZE:
+                things.append(_more(post_id, batch))
+                batch = []
+            batch.extend(ids)
+        if batch:
+            things.append(_more(post_id, batch))
+        return [_listing([{'kind': 't3', 'data': self.submission_data(post)}]), _listing(things)]
+
+    def more_children(self, link_id, ids):
+        post = self.post(link_id[3:])
+        by_id = {comment['id']: comment for comment in post['comments']}
+        depth = {}
+        things = []
+        for comment_id in ids:
+            comment = by_id[comment_id]
+            parent = self.parent_id(post, comment)
+            depth[comment_id] = depth.get(parent[3:], -1) + 1 if parent.startswith('t1_') else 0
+            things.append({'kind': 't1', 'data': self.comment_data(post, comment, depth[comment_id])})
+        return {'json': {'errors': [], 'data': {'things': things}}}
+
+
+def _listing(children, after=None):
+    return {'kind': 'Listing', 'data': {'after': after, 'before': None, 'dist': len(children), 'children': children}}
+
+
+def _more(post_id, ids):
+    return {'kind': 'more', 'data': {
+        'count': len(ids), 'name': 't1_' + ids[0], 'id': ids[0], 'parent_id': 't3_' + post_id,
+        'depth': 0, 'children': ids}}
+
+
+class RequestBudget:
+    """Reddit-style fixed-window request budget."""
+
+    def __init__(self, budget, window):
+        self.budget = budget
+        self.window = window
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """(accepted, headers) for one request."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.window:
+                self.window_start, self.used = now, 0
+            reset = max(1, int(self.window - (now - self.window_start) + 0.999))
+            accepted = self.used < self.budget
+            if accepted:
+                self.used += 1
+            else:
+                self.rejected += 1
+            return accepted, {
+                'x-ratelimit-used': str(self.used),
+                'x-ratelimit-remaining': str(float(self.budget - self.used)),
+                'x-ratelimit-reset': str(reset),
+            }
+
+
+def make_handler(corpus, budget, latency=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _form(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+
+        def _handle(self, method):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            form = self._form() if method == 'POST' else {}
+            parts = [p for p in url.path.split('/') if p]
+            if latency:
+                time.sleep(latency)
+            if parts == ['api', 'v1', 'access_token']:
+                return self._send(200, {'access_token': 'mock-token', 'token_type': 'bearer',
+                                        'expires_in': 86400, 'scope': '*'})
+            accepted, headers = budget.take()
+            if not accepted:
+                headers['Retry-After'] = headers['x-ratelimit-reset']
+                return self._send(429, {'message': 'Too Many Requests', 'error': 429}, headers)
+            try:
+                if len(parts) >= 3 and parts[0] == 'r' and parts[2] in LISTINGS and method == 'GET':
+                    limit = min(int(query.get('limit', 25)), 100)
+                    return self._send(200, corpus.listing(parts[1], parts[2], limit, query.get('after')), headers)
+                if len(parts) >= 2 and parts[0] == 'comments' and method == 'GET':
+                    return self._send(200, corpus.comments(parts[1]), headers)
+                if parts == ['api', 'info'] and method == 'GET':
+                    return self._send(200, corpus.info(query.get('id', '').split(',')[:100]), headers)
+                if parts == ['api', 'morechildren'] and method == 'POST':
+                    return self._send(200, corpus.more_children(form['link_id'], form['children'].split(',')), headers)
+            except KeyError:
+                pass
+            return self._send(404, {'message': 'Not Found', 'error': 404}, headers)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+    return Handler
+
+
+def serve(database_dir, host='127.0.0.1', port=8765, budget=1000, window=600, latency=0.0, page_size=20):
+    """Start the mock API in a background thread; returns the server (call shutdown() to stop)."""
+    handler = make_handler(MockCorpus(database_dir, page_size), RequestBudget(budget, window), latency)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a corpus through a local stand-in of the Reddit API')
+    parser.add_argument('database_dir', help='Corpus in scraper layout (<dir>/<subreddit>/<id>.json files or post shards)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--budget', type=int, default=1000, help='Requests allowed per window')
+    parser.add_argument('--window', type=float, default=600, help='Rate-limit window in seconds')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added delay per request in seconds')
+    parser.add_argument('--page_size', type=int, default=20, help='Top-level comment threads returned inline')
+    args = parser.parse_args()
+
+    server = serve(args.database_dir, args.host, args.port, args.budget, args.window, args.latency, args.page_size)
+    print(f"Mock Reddit API on http://{args.host}:{server.server_address[1]} serving {args.database_dir}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""Compressed, sharded storage for scraped posts.
+
+Instead of one pretty-printed <database_dir>/<subreddit>/<post id>.json file
+per post, a subreddit directory can hold
+
+    posts-00000.jsonl.gz, posts-00001.jsonl.gz, ...   shards of posts, one
+        compact JSON line per post, each compressed as its own gzip member
+        (so a shard is still a valid .gz file for zcat)
+    posts.index.jsonl   one {"id", "shard", "offset", "length", "sha1"} line
+        per stored post
+
+Shards and index are append-only. Storing a post again (e.g. after a refresh)
+appends a new copy and index line; the last line for an id wins. Because
+every post is its own gzip member, a post is read by id with one seek and one
+decompress, and scan() reads each shard front to back.
+
+Both layouts can live in the same directory; iter_database() and read_post()
+serve either, preferring the shard copy of a post stored both ways. Convert
+an existing database with
+
+    python reddit_eda/scripts/post_store.py --database_dir reddit_eda/database/ [--delete_json]
+
+Packed posts are stored as compact JSON, so their sha1 differs from the
+pretty-printed file's and the next corpus_index.py update reparses them.
+"""
+import os
+import gzip
+import json
+import zlib
+import hashlib
+import argparse
+import threading
+
+SHARD_BYTES = 64 << 20  # start a new shard once the current one is this large
+INDEX_NAME = 'posts.index.jsonl'
+SHARD_PATTERN = 'posts-{:05d}.jsonl.gz'
+COMPRESSLEVEL = 6
+
+
+def decompress_record(data):
+    """The JSON line of one stored post from its gzip member."""
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def read_record(ref, handles=None):
+    """Raw JSON bytes of a stored post from a (shard path, offset, length) ref.
+
+    Pass a dict as handles to keep shard files open across calls.
+    """
+    shard_path, offset, length = ref
+    if handles is None:
+        with open(shard_path, 'rb') as f:
+            f.seek(offset)
+            return decompress_record(f.read(length))
+    f = handles.get(shard_path)
+    if f is None:
+        f = handles[shard_path] = open(shard_path, 'rb')
+    f.seek(offset)
+    return decompress_record(f.read(length))
+
+
+def is_sharded(directory):
+    return os.path.exists(os.path.join(directory, INDEX_NAME))
+
+
+class PostStore:
+    """Sharded post store of one subreddit directory."""
+
+    def __init__(self, directory, shard_bytes=SHARD_BYTES):
+        self.directory = directory
+        self.shard_bytes = shard_bytes
+        self.entries = {}  # post id -> index record
+        self._lock = threading.Lock()
+        self._shard = None
+        self._index = None
+        self._index_end = 0  # bytes of the index up to its last complete line
+        self._shard_ends = {}  # shard -> end of its last indexed record
+        index_path = os.path.join(directory, INDEX_NAME)
+        if os.path.exists(index_path):
+            sizes = {}
+            with open(index_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn write at the tail
+                    if not line.endswith(b'\n'):
+                        break
+                    self._index_end += len(line)
+                    if entry['shard'] not in sizes:
+                        shard_path = os.path.join(directory, entry['shard'])
+                        sizes[entry['shard']] = os.path.getsize(shard_path) if os.path.exists(shard_path) else 0
+                    # An index line is written after its record, so this only
+                    # drops entries whose shard was truncated
+                    end = entry['offset'] + entry['length']
+                    if end <= sizes[entry['shard']]:
+                        self.entries[entry['id']] = entry
+                        self._shard_ends[entry['shard']] = max(end, self._shard_ends.get(entry['shard'], 0))
+
+    def __contains__(self, post_id):
+        return post_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def ids(self):
+        return list(self.entries)
+
+    def ref(self, post_id):
+        entry = self.entries[post_id]
+        return os.path.join(self.directory, entry['shard']), entry['offset'], entry['length']
+
+    def raw(self, post_id):
+        return read_record(self.ref(post_id))
+
+    def get(self, post_id):
+        return json.loads(self.raw(post_id))
+
+    def scan(self):
+        """Yield (post id, post) for every stored post, reading shards sequentially."""
+        by_shard = {}
+        for entry in self.entries.values():
+            by_shard.setdefault(entry['shard'], []).append(entry)
+        for shard in sorted(by_shard):
+            with open(os.path.join(self.directory, shard), 'rb') as f:
+                for entry in sorted(by_shard[shard], key=lambda e: e['offset']):
+                    f.seek(entry['offset'])
+                    yield entry['id'], json.loads(decompress_record(f.read(entry['length'])))
+
+    def _open_for_append(self):
+        os.makedirs(self.directory, exist_ok=True)
+        shards = sorted(name for name in os.listdir(self.directory)
+                        if name.startswith('posts-') and name.endswith('.jsonl.gz'))
+        shard = shards[-1] if shards else SHARD_PATTERN.format(0)
+        shard_path = os.path.join(self.directory, shard)
+        # Cut off any record a crash left without an index line
+        end = self._shard_ends.get(shard, 0)
+        if os.path.exists(shard_path) and os.path.getsize(shard_path) > end:
+            with open(shard_path, 'r+b') as f:
+                f.truncate(end)
+        index_path = os.path.join(self.directory, INDEX_NAME)
+        if os.path.exists(index_path) and os.path.getsize(index_path) > self._index_end:
+            with open(index_path, 'r+b') as f:
+                f.truncate(self._index_end)
+        self._shard_name = shard
+        self._shard = open(shard_path, 'ab')
+        self._index = open(index_path, 'a', encoding='utf-8')
+
+    def _roll(self):
+        self._shard.close()
+        number = int(self._shard_name[len('posts-'):-len('.jsonl.gz')]) + 1
+        self._shard_name = SHARD_PATTERN.format(number)
+        self._shard = open(os.path.join(self.directory, self._shard_name), 'ab')
+
+    def put(self, post, fsync=True):
+        """Append a post (a dict with an 'id'); replaces any stored copy."""
+        line = json.dumps(post, ensure_ascii=False).encode('utf-8') + b'\n'
+        data = gzip.compress(line, compresslevel=COMPRESSLEVEL, mtime=0)
+        with self._lock:
+            if self._shard is None:
+                self._open_for_append()
+            elif self._shard.tell() >= self.shard_bytes:
+                self._roll()
+            entry = {'id': post['id'], 'shard': self._shard_name, 'offset': self._shard.tell(),
+                     'length': len(data), 'sha1': hashlib.sha1(line).hexdigest()}
+            self._shard.write(data)
+            self._shard_ends[self._shard_name] = entry['offset'] + len(data)
+            self._shard.flush()
+            if fsync:
+                os.fsync(self._shard.fileno())
+            self._index.write(json.dumps(entry) + '\n')
+            self._index.flush()
+            self._index_end = self._index.tell()
+            if fsync:
+                os.fsync(self._index.fileno())
+            self.entries[post['id']] = entry
+        return entry
+
+    def close(self):
+        if self._shard is not None:
+            self._shard.close()
+            self._index.close()
+            self._shard = self._index = None
+
+
+def iter_database(base_dir, subreddits):
+    """Yield (subreddit, post id, source) for every post in either layout.
+
+    source is a .json file path, or a (shard path, offset, length) ref with
+    the post's sha1 appended for sharded posts. Posts come in a stable
+    order: sharded ones in index order, then files by name.
+    """
+    for subreddit in subreddits:
+        sub_dir = os.path.join(base_dir, subreddit)
+        if not os.path.isdir(sub_dir):
+            continue
+        stored = set()
+        if is_sharded(sub_dir):
+            store = PostStore(sub_dir)
+            for post_id, entry in store.entries.items():
+                stored.add(post_id)
+                yield subreddit, post_id, store.ref(post_id) + (entry['sha1'],)
+        for fname in sorted(os.listdir(sub_dir)):
+            if fname.endswith('.json') and fname[:-len('.json')] not in stored:
+                yield subreddit, fname[:-len('.json')], os.path.join(sub_dir, fname)
+
+
+def read_post_bytes(source, handles=None):
+    """Raw JSON bytes of a post from an iter_database() source."""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    return read_record(source[:3], handles)
+
+
+def read_post(source):
+    return json.loads(read_post_bytes(source))
+
+
+def pack_directory(sub_dir, delete_json=False, shard_bytes=SHARD_BYTES):
+    """Move the .json post files of one subreddit directory into its store."""
+    store = PostStore(sub_dir, shard_bytes)
+    names = sorted(name for name in os.listdir(sub_dir) if name.endswith('.json'))
+    packed = []
+    for name in names:
+        path = os.path.join(sub_dir, name)
+        with open(path, 'r', encoding='utf-8') as f:
+            post = json.load(f)
+        # A file rewritten since an earlier pack (e.g. a --storage json
+        # refresh) differs from its stored copy and is packed again
+        if post['id'] not in store or store.get(post['id']) != post:
+            store.put(post, fsync=False)
+            packed.append(name)
+    if store._shard is not None:
+        os.fsync(store._shard.fileno())
+        os.fsync(store._index.fileno())
+    store.close()
+    if delete_json:
+        # Every file is now either packed or identical to its stored copy
+        for name in names:
+            os.remove(os.path.join(sub_dir, name))
+    return len(packed), len(names)
+
+
+def main():
+    from corpus_index import DATABASE_DIR, SUBREDDITS
+
+    parser = argparse.ArgumentParser(description='Pack per-post JSON files into compressed shards')
+    parser.add_argument('--database_dir', default=DATABASE_DIR)
+    parser.add_argument('--subreddits', nargs='+', default=SUBREDDITS)
+    parser.add_argument('--delete_json', action='store_true', help='Remove the JSON files once packed')
+    parser.add_argument('--shard_mb', type=int, default=SHARD_BYTES >> 20, help='Shard size in MB')
+    args = parser.parse_args()
+
+    for subreddit in args.subreddits:
+        sub_dir = os.path.join(args.database_dir, subreddit)
+        if not os.path.isdir(sub_dir):
+            continue
+        before = sum(os.path.getsize(os.path.join(sub_dir, n)) for n in os.listdir(sub_dir))
+        packed, files = pack_directory(sub_dir, args.delete_json, args.shard_mb << 20)
+        after = sum(os.path.getsize(os.path.join(sub_dir, n)) for n in os.listdir(sub_dir)
+                    if not n.endswith('.json'))
+        print(f"r/{subreddit}: packed {packed} of {files} post files; "
+              f"{before / 1e6:.1f} MB directory, {after / 1e6:.1f} MB of shards")
+    print("The next corpus_index.py update reparses the packed posts (their stored JSON is compact, so sha1s change)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Thread-safe token bucket with adaptive backoff.
+
+One TokenBucket is shared by every scraping thread, so the process as a whole
+stays under the API budget however many requests are in flight. Tokens refill
+at `rate` per second up to `capacity`. throttle(), called on a 429, cuts the
+rate multiplicatively and pauses all callers (for Retry-After when the server
+gives one, otherwise an exponential backoff); every success() then adds the
+rate back a step at a time. The bucket settles just under whatever the server
+actually allows.
+"""
+import time
+import threading
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, min_rate=None, backoff=0.5, recovery=None, max_backoff=60.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.min_rate = min_rate or rate / 20
+        self.backoff = backoff
+        self.recovery = recovery if recovery is not None else rate / 50
+        self.max_backoff = max_backoff
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.throttles = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, tokens):
+        """Take tokens if available; otherwise return how long to wait before retrying."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if now < self.paused_until:
+                return self.paused_until - now
+            # Tolerance so float rounding in the refill cannot leave a caller
+            # waiting on a vanishingly small shortfall
+            if self.tokens >= tokens - 1e-9:
+                self.tokens = max(0.0, self.tokens - tokens)
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available, then take them."""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            self._sleep(wait)
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without blocking; True if they were available."""
+        return self._reserve(tokens) <= 0
+
+    def throttle(self, retry_after=None):
+        """Back off after the server rejected a request for exceeding its limit."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.consecutive_throttles += 1
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+            self.tokens = 0.0
+            if retry_after is None:
+                retry_after = min(self.max_backoff, 2 ** self.consecutive_throttles / self.rate)
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+    def success(self, ceiling=None):
+        """Recover the rate after an accepted request, never above ceiling (requests/second)."""
+        with self._lock:
+            self._refill(self._clock())
+            self.consecutive_throttles = 0
+            self.rate = min(self.max_rate, self.rate + self.recovery)
+            if ceiling is not None:
+                self.rate = max(self.min_rate, min(self.rate, ceiling))
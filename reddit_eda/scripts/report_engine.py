@@ -0,0 +1,305 @@
+"""One-scan engine for the subreddit user-statistics reports.
+
+Each report is a plugin with three hooks: start(index) before the scan,
+consume(batch) for every batch of index rows, and render(index, outdir)
+afterwards. run_reports() makes a single pass over the event index, feeds
+every batch to every registered report, then renders all outputs, so
+refreshing the whole dashboard costs one scan instead of one per report.
+
+    python reddit_eda/scripts/report_engine.py                     # all reports
+    python reddit_eda/scripts/report_engine.py posts_series monthly_aggregation
+"""
+import os
+import csv
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from corpus_index import ANALYSIS_DIR, IGNORE_USERS, POST, load_or_build_index, top_counts
+from time_buckets import DEFAULT_LOOKBACK_DAYS, bucket, bucket_labels, bucket_matrix, bucket_range, utc_now, window_start
+
+BATCH_COLUMNS = ('author', 'type', 'created_utc', 'text_len', 'word_count')
+BATCH_SIZE = 1_000_000
+
+
+class Report:
+    """Base plugin. Reports that only read the index's maintained aggregates
+    set needs_scan = False and skip consume(). Time-series reports set
+    windowed = True and take a lookback_days argument."""
+    name = None
+    needs_scan = True
+    windowed = False
+
+    def start(self, index):
+        pass
+
+    def consume(self, batch):
+        pass
+
+    def render(self, index, outdir):
+        raise NotImplementedError
+
+
+class AuthorTally:
+    """Per-author event counts with Counter.most_common tie order (first seen row)."""
+
+    def __init__(self, n_authors):
+        self.counts = np.zeros(n_authors, dtype=np.int64)
+        self.first = np.full(n_authors, np.iinfo(np.int64).max, dtype=np.int64)
+
+    def add(self, authors, rows):
+        self.counts += np.bincount(authors, minlength=len(self.counts))
+        np.minimum.at(self.first, authors, rows)
+
+    def most_common(self, n):
+        order = np.lexsort((self.first, -self.counts))
+        return order[self.counts[order] > 0][:n]
+
+
+class KeyedSums:
+    """Sums of several statistics per int64 key, accumulated across batches."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self._parts = []
+
+    def add(self, keys, **values):
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        sums = {stat: np.bincount(inverse, weights=values[stat], minlength=len(uniq)).astype(np.int64)
+                for stat in self.stats}
+        self._parts.append((uniq, sums))
+
+    def result(self):
+        if not self._parts:
+            return np.array([], dtype=np.int64), {stat: np.array([], dtype=np.int64) for stat in self.stats}
+        keys = np.concatenate([uniq for uniq, _ in self._parts])
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        return uniq, {stat: np.bincount(inverse, weights=np.concatenate([sums[stat] for _, sums in self._parts]),
+                                        minlength=len(uniq)).astype(np.int64)
+                      for stat in self.stats}
+
+
+def month_matrix(keys, sums, top_codes):
+    """Split (author << 21) | month keys into dense top-users x months matrices.
+
+    Columns are the months in which any of the top users was active.
+    """
+    authors, months = keys >> 21, (keys & 0xFFFFF).astype('datetime64[M]')
+    mine = np.isin(authors, top_codes)
+    columns = np.unique(months[mine])
+    return columns, {stat: bucket_matrix(authors, months, top_codes, columns, weights=values).astype(np.int64)
+                     for stat, values in sums.items()}
+
+
+def _years(lookback_days):
+    return f"{lookback_days / 365:g}"
+
+
+class TopUsersBarReport(Report):
+    """Top users by posts + comments across all subreddits (bar graph)."""
+    name = 'top_users_bar'
+    needs_scan = False
+
+    def __init__(self, top_n=100):
+        self.top_n = top_n
+
+    def render(self, index, outdir):
+        user_counts = index.total_counts * index.valid_authors(IGNORE_USERS)
+        top_codes, counts = top_counts(user_counts, self.top_n)
+        if not len(top_codes):
+            print("No user data found.")
+            return
+        usernames = [index.authors[code] for code in top_codes]
+        plt.figure(figsize=(20, 8))
+        plt.bar(usernames, counts.tolist())
+        plt.xticks(rotation=90)
+        plt.xlabel("Username")
+        plt.ylabel("Number of Posts + Comments")
+        plt.title(f"Top {self.top_n} Reddit Users by Posts + Comments (All Subreddits)")
+        plt.tight_layout()
+        plt.savefig(os.path.join(outdir, 'top_users_bar_graph_across_subreddits.png'))
+        plt.close()
+        print(f"Saved bar graph to {os.path.join(outdir, 'top_users_bar_graph_across_subreddits.png')}")
+
+
+class ActivitySeriesReport(Report):
+    """Monthly posts + comments of the most active users over the look-back window."""
+    name = 'monthly_series'
+    needs_scan = False
+    windowed = True
+
+    def __init__(self, top_n=15, lookback_days=DEFAULT_LOOKBACK_DAYS):
+        self.top_n = top_n
+        self.lookback_days = lookback_days
+
+    def render(self, index, outdir):
+        monthly = index.monthly
+        user_counts = np.bincount(monthly['author'], weights=monthly['count'], minlength=len(index.authors))
+        top_codes, _ = top_counts(user_counts * index.valid_authors(IGNORE_USERS), self.top_n)
+        if not len(top_codes):
+            print("No user data found.")
+            return
+        top_users = [index.authors[code] for code in top_codes]
+        # Every month overlapping the window, oldest first
+        now = utc_now()
+        months = bucket_range(window_start(self.lookback_days, now), now, 'M')
+        month_labels = bucket_labels(months)
+        user_month_counts = bucket_matrix(monthly['author'], monthly['month'], top_codes, months, weights=monthly['count'])
+
+        plt.figure(figsize=(20, 10))
+        for user, counts in zip(top_users, user_month_counts.astype(int)):
+            plt.plot(month_labels, counts, label=user)
+        plt.xticks(rotation=90)
+        plt.xlabel("Month")
+        plt.ylabel("Number of Posts + Comments")
+        plt.title(f"Top {self.top_n} Reddit Users' Activity Over the Past {_years(self.lookback_days)} Years (All Subreddits)")
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(os.path.join(outdir, 'top_15_users_timeseries.png'))
+        plt.close()
+        print(f"Saved time-series graph to {os.path.join(outdir, 'top_15_users_timeseries.png')}")
+
+
+class PostsSeriesReport(Report):
+    """Monthly post counts (posts only) of the top posters in the window."""
+    name = 'posts_series'
+    windowed = True
+
+    def __init__(self, top_n=15, lookback_days=DEFAULT_LOOKBACK_DAYS):
+        self.top_n = top_n
+        self.lookback_days = lookback_days
+
+    def start(self, index):
+        self.valid = index.valid_authors(IGNORE_USERS)
+        self.cutoff = window_start(self.lookback_days)
+        self.tally = AuthorTally(len(index.authors))
+        self.months = KeyedSums(('count',))
+
+    def consume(self, batch):
+        keep = (self.valid[batch['author']] & (batch['type'] == POST)
+                & (batch['created_utc'] > 0) & (batch['created_utc'] >= self.cutoff))
+        authors = batch['author'][keep].astype(np.int64)
+        self.tally.add(authors, batch['rows'][keep])
+        self.months.add((authors << 21) | bucket(batch['created_utc'][keep], 'M').astype(np.int64), count=np.ones(len(authors)))
+
+    def render(self, index, outdir):
+        top_codes = self.tally.most_common(self.top_n)
+        top_users = [index.authors[code] for code in top_codes]
+        months, matrices = month_matrix(*self.months.result(), top_codes)
+        all_months = bucket_labels(months)
+        user_month_counts = matrices['count'].tolist()
+
+        csv_path = os.path.join(outdir, "top_15_users_by_posts_timeseries.csv")
+        with open(csv_path, "w", newline='', encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["user"] + all_months)
+            for user, counts in zip(top_users, user_month_counts):
+                writer.writerow([user] + counts)
+        print(f"Saved monthly post counts for top {self.top_n} users to {csv_path}")
+
+        plt.figure(figsize=(20, 10))
+        for user, counts in zip(top_users, user_month_counts):
+            plt.plot(all_months, counts, marker='o', label=user)
+        plt.xlabel('Month')
+        plt.ylabel('Number of Posts')
+        plt.title(f'Top {self.top_n} Users by Posts (Monthly, Last {_years(self.lookback_days)} Years)')
+        plt.xticks(rotation=90)
+        plt.legend()
+        plt.tight_layout()
+        plot_path = os.path.join(outdir, "top_15_users_by_posts_timeseries.png")
+        plt.savefig(plot_path)
+        plt.close()
+        print(f"Saved plot to {plot_path}")
+
+
+class MonthlyAggregationReport(Report):
+    """Per user/month post, comment, word and text-length stats of the most active users."""
+    name = 'monthly_aggregation'
+    windowed = True
+    STATS = ('post_count', 'comment_count', 'total_words', 'total_chars', 'n_texts')
+
+    def __init__(self, top_n=15, lookback_days=DEFAULT_LOOKBACK_DAYS):
+        self.top_n = top_n
+        self.lookback_days = lookback_days
+
+    def start(self, index):
+        self.valid = index.valid_authors(IGNORE_USERS)
+        self.cutoff = window_start(self.lookback_days)
+        self.tally = AuthorTally(len(index.authors))
+        self.months = KeyedSums(self.STATS)
+
+    def consume(self, batch):
+        keep = self.valid[batch['author']] & (batch['created_utc'] > 0) & (batch['created_utc'] >= self.cutoff)
+        authors = batch['author'][keep].astype(np.int64)
+        is_post = batch['type'][keep] == POST
+        text_len = batch['text_len'][keep]
+        self.tally.add(authors, batch['rows'][keep])
+        self.months.add(
+            (authors << 21) | bucket(batch['created_utc'][keep], 'M').astype(np.int64),
+            post_count=is_post,
+            comment_count=~is_post,
+            total_words=np.where(text_len > 0, batch['word_count'][keep], 0),
+            total_chars=text_len,
+            n_texts=text_len > 0,
+        )
+
+    def render(self, index, outdir):
+        top_codes = self.tally.most_common(self.top_n)
+        top_users = [index.authors[code] for code in top_codes]
+        months, data = month_matrix(*self.months.result(), top_codes)
+        all_months = bucket_labels(months)
+        n_texts = data['n_texts']
+        avg_text_length = np.divide(data['total_chars'], n_texts, out=np.zeros(n_texts.shape), where=n_texts > 0)
+        csv_path = os.path.join(outdir, "top_15_users_monthly_aggregation.csv")
+        with open(csv_path, "w", newline='', encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["user", "month", "post_count", "comment_count", "total_count", "total_words", "avg_text_length"])
+            for i, user in enumerate(top_users):
+                for j, month in enumerate(all_months):
+                    posts, comments = data['post_count'][i, j], data['comment_count'][i, j]
+                    writer.writerow([
+                        user, month, posts, comments, posts + comments, data['total_words'][i, j],
+                        f"{avg_text_length[i, j]:.1f}"
+                    ])
+        print(f"Saved monthly aggregation for top {self.top_n} users to {csv_path}")
+
+
+REPORTS = {cls.name: cls for cls in (TopUsersBarReport, ActivitySeriesReport, PostsSeriesReport, MonthlyAggregationReport)}
+
+
+def run_reports(reports, index=None, outdir=ANALYSIS_DIR, batch_size=BATCH_SIZE):
+    """Run all reports off a single pass over the event index."""
+    if index is None:
+        index = load_or_build_index()
+    for report in reports:
+        report.start(index)
+    scanning = [report for report in reports if report.needs_scan]
+    if scanning:
+        for start in range(0, len(index), batch_size):
+            end = min(start + batch_size, len(index))
+            batch = {name: np.asarray(getattr(index, name)[start:end]) for name in BATCH_COLUMNS}
+            batch['rows'] = np.arange(start, end, dtype=np.int64)
+            for report in scanning:
+                report.consume(batch)
+    os.makedirs(outdir, exist_ok=True)
+    for report in reports:
+        report.render(index, outdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render several user-statistics reports from one corpus scan')
+    parser.add_argument('reports', nargs='*', help=f'Reports to run (default: all of {", ".join(REPORTS)})')
+    parser.add_argument('--outdir', default=ANALYSIS_DIR, help='Directory to save outputs')
+    parser.add_argument('--lookback_days', type=float, default=DEFAULT_LOOKBACK_DAYS,
+                        help='Look-back window of the time-series reports, in days')
+    args = parser.parse_args()
+    unknown = [name for name in args.reports if name not in REPORTS]
+    if unknown:
+        parser.error(f"unknown report(s): {', '.join(unknown)}")
+
+    reports = [REPORTS[name](lookback_days=args.lookback_days) if REPORTS[name].windowed else REPORTS[name]()
+               for name in args.reports or REPORTS]
+    run_reports(reports, outdir=args.outdir)
+
+
+if __name__ == '__main__':
+    main()
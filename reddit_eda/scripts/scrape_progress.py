@@ -0,0 +1,105 @@
+"""Write-ahead progress log for resumable scrape jobs.
+
+A scrape job is one listing of one subreddit (e.g. ARFID/top/all). Progress
+is appended to a JSONL log, flushed and fsynced before the work it describes
+is acted on:
+
+    {"op": "page", "job": "ARFID/top/all", "after": "t3_abc", "ids": [...]}
+        a listing page was fetched: its submission ids and the cursor of the
+        next page (null once the listing is exhausted)
+    {"op": "done", "job": "ARFID/top/all", "id": "abc"}
+        a submission was saved
+
+Replaying the log gives every job's cursor and the listed ids that are not
+done yet, so a restarted run scrapes those first and continues the listing
+from the saved cursor without re-listing anything; rerunning with a higher
+limit continues a finished job's listing the same way. A torn last line from a
+crash mid-write is ignored. The log is compacted on load.
+"""
+import os
+import json
+import threading
+
+
+def job_key(subreddit, listing, time_filter):
+    return f"{subreddit}/{listing}/{time_filter}"
+
+
+class JobState:
+    def __init__(self):
+        self.after = None        # cursor of the next listing page
+        self.listed = []         # submission ids in listing order
+        self.done = set()
+        self.exhausted = False   # the listing has no further pages
+
+    @property
+    def pending(self):
+        return [sid for sid in self.listed if sid not in self.done]
+
+    def listing_done(self, limit):
+        return self.exhausted or len(self.listed) >= limit
+
+    def complete(self, limit):
+        return self.listing_done(limit) and not self.pending
+
+
+class ProgressLog:
+    def __init__(self, path):
+        self.path = path
+        self.jobs = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        break  # torn write at the tail
+            self._compact()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def job(self, key):
+        return self.jobs.setdefault(key, JobState())
+
+    def _apply(self, record):
+        state = self.job(record['job'])
+        if record['op'] == 'page':
+            known = set(state.listed)
+            state.listed.extend(sid for sid in record['ids'] if sid not in known)
+            state.after = record['after']
+            state.exhausted = record['after'] is None
+        elif record['op'] == 'done':
+            state.done.add(record['id'])
+
+    def _records(self):
+        for key, state in self.jobs.items():
+            yield {'op': 'page', 'job': key, 'after': state.after, 'ids': state.listed}
+            for sid in state.listed:
+                if sid in state.done:
+                    yield {'op': 'done', 'job': key, 'id': sid}
+
+    def _compact(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self._records():
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _append(self, record):
+        with self._lock:
+            self._apply(record)
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def page(self, key, after, ids):
+        self._append({'op': 'page', 'job': key, 'after': after, 'ids': list(ids)})
+
+    def done(self, key, submission_id):
+        self._append({'op': 'done', 'job': key, 'id': submission_id})
+
+    def close(self):
+        self._file.close()
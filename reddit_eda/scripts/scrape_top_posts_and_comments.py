@@ -1,87 +1,396 @@
 import praw
+import prawcore
 import os
 import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from praw.models import MoreComments
 from dotenv import load_dotenv
-import time
+from corpus_index import SUBREDDITS
+from rate_limit import TokenBucket
+from scrape_progress import ProgressLog, job_key
+from post_store import PostStore, iter_database, read_post
 
 load_dotenv(dotenv_path='reddit_eda/.env')    # Load environment variables from .env file
 
 # --- CONFIGURATION ---
-SUBREDDIT = 'ARFID'   
-TOP_POST_LIMIT = 1000
-OUTPUT_DIR = f'reddit_eda/database/{SUBREDDIT}/'
+DATABASE_DIR = 'reddit_eda/database/'
+LISTINGS = ('top', 'hot', 'new', 'controversial', 'rising')
+TIME_FILTERS = ('all', 'year', 'month', 'week', 'day', 'hour')
+TOP_POST_LIMIT = 1000  # per subreddit and listing
+PAGE_SIZE = 100
+STORAGES = ('json', 'shards')  # per-post JSON files or compressed shards (post_store.py)
+WORKERS = 4
+# Reddit allows 100 OAuth requests per minute per client
+REQUESTS_PER_SECOND = 100 / 60
+BURST = 10
+MAX_RETRIES = 8
 
-# --- SETUP ---
-reddit = praw.Reddit(
-    client_id=os.getenv('REDDIT_CLIENT_ID'),
-    client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
-    user_agent=os.getenv('REDDIT_USER_AGENT')
-)
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+class RateLimitedRequestor(prawcore.Requestor):
+    """Requestor that takes a token from a shared TokenBucket before every HTTP
+    request and retries 429s after backing the bucket off."""
 
-def get_comment_context(comment):
+    def __init__(self, *args, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    def request(self, *args, **kwargs):
+        for _ in range(MAX_RETRIES):
+            self.limiter.acquire()
+            response = super().request(*args, **kwargs)
+            if response.status_code != 429:
+                self.limiter.success(ceiling=_budget_rate(response.headers))
+                return response
+            retry_after = response.headers.get('Retry-After')
+            self.limiter.throttle(float(retry_after) if retry_after else None)
+        return response  # still 429: let prawcore raise TooManyRequests
+
+
+def _budget_rate(headers):
+    """Requests/second left in the current window, from Reddit's x-ratelimit headers."""
+    try:
+        return float(headers['x-ratelimit-remaining']) / max(float(headers['x-ratelimit-reset']), 1.0)
+    except (KeyError, ValueError):
+        return None
+
+
+def make_reddit(limiter, api_url=None):
+    """A PRAW client whose requests all go through limiter; api_url points it at a mock API."""
+    kwargs = {}
+    if api_url:
+        kwargs = {'oauth_url': api_url, 'reddit_url': api_url}
+    return praw.Reddit(
+        client_id=os.getenv('REDDIT_CLIENT_ID') or ('mock' if api_url else None),
+        client_secret=os.getenv('REDDIT_CLIENT_SECRET') or ('mock' if api_url else None),
+        user_agent=os.getenv('REDDIT_USER_AGENT') or ('reddit_eda mock scraper' if api_url else None),
+        requestor_class=RateLimitedRequestor,
+        requestor_kwargs={'limiter': limiter},
+        **kwargs
+    )
+
+
+# PRAW instances are not thread-safe, so each worker thread gets its own
+# client; they share the limiter.
+_local = threading.local()
+
+
+def thread_reddit(limiter, api_url=None):
+    if getattr(_local, 'reddit', None) is None:
+        _local.reddit = make_reddit(limiter, api_url)
+    return _local.reddit
+
+def build_comment_contexts(comments, stored=None):
     """
-    Returns the list of parent comments (context) up to the root post for a given comment.
+    Returns {comment id: list of parent comments (context) up to the root post}
+    for every comment of an already-fetched forest, without any requests.
+    Ancestor chains are memoized, so each comment's chain is built once from
+    its parent's instead of walking comment.parent() (which PRAW may resolve
+    with a lazy fetch) once per ancestor per comment.
+
+    stored maps comment id -> saved comment record (with its own 'context');
+    a chain that reaches a saved comment continues from that record's context.
     """
-    context = []
-    current = comment
-    while True:
-        try:
-            parent = current.parent()
-            if isinstance(parent, praw.models.Comment):
-                context.append({
-                    'id': parent.id,
-                    'author': str(parent.author),
-                    'body': parent.body,
-                    'created_utc': parent.created_utc
-                })
-                current = parent
-            else:
+    stored = stored or {}
+    by_name = {comment.name: comment for comment in comments}
+    chains = {}  # comment name -> tuple of ancestor records, root first
+    for comment in comments:
+        path = []
+        seen = set()  # names on path, for the cycle check
+        current = comment
+        # Walk up until an ancestor with a known chain, the post, or a parent
+        # that is not in the forest
+        while current.name not in chains:
+            path.append(current)
+            seen.add(current.name)
+            parent = by_name.get(current.parent_id)
+            if parent is None or parent.name in seen:
+                chains[current.name] = _stored_chain(stored, current.parent_id)
+                path.pop()
                 break
-        except Exception:
-            break
-    return list(reversed(context))
+            current = parent
+        for node in reversed(path):
+            parent = by_name[node.parent_id]
+            chains[node.name] = chains[parent.name] + ({
+                'id': parent.id,
+                'author': str(parent.author),
+                'body': parent.body,
+                'created_utc': parent.created_utc
+            },)
+    return {comment.id: list(chains[comment.name]) for comment in comments}
+
+def _stored_chain(stored, parent_id):
+    parent = stored.get(parent_id[3:]) if parent_id and parent_id.startswith('t1_') else None
+    if parent is None:
+        return ()
+    return tuple(parent.get('context') or ()) + ({
+        'id': parent['id'],
+        'author': parent['author'],
+        'body': parent['body'],
+        'created_utc': parent['created_utc']
+    },)
+
+def comment_record(comment, context):
+    return {
+        'id': comment.id,
+        'author': str(comment.author),
+        'body': comment.body,
+        'created_utc': comment.created_utc,
+        'score': comment.score,
+        'parent_id': comment.parent_id,
+        'link_id': comment.link_id,
+        'context': context
+    }
+
+def scrape_submission(reddit, submission_id):
+    """Fetch one submission with its full comment forest."""
+    submission = reddit.submission(id=submission_id)
+    post_data = {
+        'id': submission.id,
+        'subreddit': str(submission.subreddit),
+        'author': str(submission.author),
+        'created_utc': submission.created_utc,
+        'title': submission.title,
+        'selftext': submission.selftext,
+        'url': submission.url,
+        'score': submission.score,
+        'num_comments': submission.num_comments,
+        'comments': []
+    }
+    submission.comments.replace_more(limit=None)
+    comments = [comment for comment in submission.comments.list() if not isinstance(comment, MoreComments)]
+    contexts = build_comment_contexts(comments)
+    for comment in comments:
+        post_data['comments'].append(comment_record(comment, contexts[comment.id]))
+    return post_data
+
+def prune_known_more(submission, known_ids):
+    """
+    Drops the "more" stubs of a freshly fetched forest that only hide comments
+    already stored, so replace_more() requests just the parts of the thread
+    with new comments. Returns the number of stubs dropped. Uses PRAW's own
+    stub gathering (as replace_more does) to know each stub's parent list;
+    these are PRAW internals (checked against the version pinned in
+    reddit_eda/requirements.txt), so if they are missing nothing is pruned and
+    replace_more() fetches every stub.
+    """
+    dropped = 0
+    try:
+        for more in submission.comments._gather_more_comments(submission.comments._comments):
+            if more.children and set(more.children) <= known_ids:
+                more._remove_from.remove(more)
+                dropped += 1
+    except AttributeError:
+        return 0
+    return dropped
+
+def refresh_submission(reddit, stored):
+    """
+    Fetches what is new in a stored submission's comment forest and merges it
+    in: (updated post, number of new comments). Stored comments are kept as
+    they are; only new ones get a context, built on top of the stored chains.
+    """
+    known = {comment['id'] for comment in stored['comments']}
+    submission = reddit.submission(id=stored['id'])
+    prune_known_more(submission, known)
+    submission.comments.replace_more(limit=None)
+    new = [comment for comment in submission.comments.list()
+           if not isinstance(comment, MoreComments) and comment.id not in known]
+    contexts = build_comment_contexts(new, stored={comment['id']: comment for comment in stored['comments']})
+    post_data = dict(stored, score=submission.score, num_comments=submission.num_comments,
+                     comments=stored['comments'] + [comment_record(comment, contexts[comment.id]) for comment in new])
+    return post_data, len(new)
+
+def save_json(post_data, output_path):
+    # Write then rename, so an interrupted run never leaves a partial file
+    # that the next run would skip as already scraped
+    with open(output_path + '.tmp', 'w') as f:
+        json.dump(post_data, f, indent=2)
+    os.replace(output_path + '.tmp', output_path)
+
+def fetch_listing_page(reddit, subreddit, listing, time_filter, after, limit):
+    """One page of a subreddit listing: (submissions, cursor of the next page)."""
+    params = {'limit': limit}
+    if after:
+        params['after'] = after
+    if listing in ('top', 'controversial'):
+        params['t'] = time_filter
+    page = reddit.get(f"r/{subreddit}/{listing}", params=params)
+    return list(page.children), page.after
+
+
+class ScrapeQueue:
+    """Schedules submissions onto the worker pool and records them in the
+    progress log once saved. A submission listed by several jobs is fetched
+    once and marked done for each of them."""
+
+    def __init__(self, pool, log, limiter, api_url, database_dir, storage='json'):
+        self.pool = pool
+        self.log = log
+        self.limiter = limiter
+        self.api_url = api_url
+        self.database_dir = database_dir
+        self.storage = storage
+        self.stores = {}  # subreddit -> PostStore
+        self.scheduled = {}
+        self.saved = 0
+        self.failed = 0
+        self.refreshed = 0
+        self.new_comments = 0
+        self._lock = threading.Lock()
+
+    def store(self, subreddit):
+        with self._lock:
+            if subreddit not in self.stores:
+                self.stores[subreddit] = PostStore(os.path.join(self.database_dir, subreddit))
+            return self.stores[subreddit]
+
+    def _path(self, subreddit, submission_id):
+        return os.path.join(self.database_dir, subreddit, f"{submission_id}.json")
+
+    def exists(self, subreddit, submission_id):
+        # Either layout counts whatever --storage is, as in iter_database()
+        return (submission_id in self.store(subreddit)
+                or os.path.exists(self._path(subreddit, submission_id)))
+
+    def save(self, subreddit, post_data):
+        if self.storage == 'shards':
+            self.store(subreddit).put(post_data)
+        else:
+            save_json(post_data, self._path(subreddit, post_data['id']))
+
+    def close(self):
+        for store in self.stores.values():
+            store.close()
+
+    def _scrape(self, subreddit, submission_id):
+        if not self.exists(subreddit, submission_id):
+            post_data = scrape_submission(thread_reddit(self.limiter, self.api_url), submission_id)
+            self.save(subreddit, post_data)
+            with self._lock:
+                self.saved += 1
+            print(f"[{self.saved}] r/{subreddit} {submission_id}: {post_data['title']}")
+
+    def _finished(self, key, submission_id, future):
+        if future.exception() is not None:
+            with self._lock:
+                self.failed += 1
+            print(f"Failed {submission_id} ({key}): {future.exception()}")
+        else:
+            self.log.done(key, submission_id)
+
+    def schedule(self, key, subreddit, submission_id):
+        future = self.scheduled.get(submission_id)
+        if future is None:
+            future = self.scheduled[submission_id] = self.pool.submit(self._scrape, subreddit, submission_id)
+        future.add_done_callback(lambda f: self._finished(key, submission_id, f))
+
+    def _refresh(self, subreddit, source):
+        post_data, n_new = refresh_submission(thread_reddit(self.limiter, self.api_url), read_post(source))
+        # Write back in the layout the post is stored in
+        if isinstance(source, str):
+            save_json(post_data, source)
+        else:
+            self.store(subreddit).put(post_data)
+        with self._lock:
+            self.refreshed += 1
+            self.new_comments += n_new
+        print(f"[{self.refreshed}] r/{subreddit} {post_data['id']}: {n_new} new comments")
+
+    def _refresh_finished(self, submission_id, future):
+        if future.exception() is not None:
+            with self._lock:
+                self.failed += 1
+            print(f"Failed to refresh {submission_id}: {future.exception()}")
+
+    def schedule_refresh(self, subreddit, submission_id, source):
+        future = self.pool.submit(self._refresh, subreddit, source)
+        future.add_done_callback(lambda f: self._refresh_finished(submission_id, f))
+
+
+def run_job(queue, reddit, subreddit, listing, time_filter, limit):
+    """Resume one listing job: re-queue what the log has listed but not saved,
+    then continue the listing from the logged cursor."""
+    key = job_key(subreddit, listing, time_filter)
+    state = queue.log.job(key)
+    if state.complete(limit):
+        print(f"{key}: already complete ({len(state.listed)} submissions)")
+        return
+    os.makedirs(os.path.join(queue.database_dir, subreddit), exist_ok=True)
+    if state.listed:
+        print(f"{key}: resuming with {len(state.pending)} pending of {len(state.listed)} listed")
+    for submission_id in state.pending:
+        queue.schedule(key, subreddit, submission_id)
+    while not state.listing_done(limit):
+        want = min(PAGE_SIZE, limit - len(state.listed))
+        submissions, after = fetch_listing_page(reddit, subreddit, listing, time_filter, state.after, want)
+        ids = [submission.id for submission in submissions]
+        # Log the page before acting on it, so a crash never loses listed ids
+        queue.log.page(key, after if ids else None, ids)
+        for submission_id in ids:
+            queue.schedule(key, subreddit, submission_id)
+        print(f"{key}: listed {len(state.listed)}/{limit}")
+
+
+def refresh_subreddit(queue, reddit, subreddit):
+    """Queue a refresh of every stored post of a subreddit whose comment count
+    has changed. Current counts come from /api/info, 100 posts per request,
+    so unchanged threads cost no more than that."""
+    sources = {post_id: source for _, post_id, source in iter_database(queue.database_dir, [subreddit])}
+    stored_counts = {post_id: read_post(source).get('num_comments') for post_id, source in sources.items()}
+    changed = 0
+    for submission in reddit.info(fullnames=['t3_' + post_id for post_id in sources]):
+        if submission.num_comments != stored_counts[submission.id]:
+            queue.schedule_refresh(subreddit, submission.id, sources[submission.id])
+            changed += 1
+    print(f"r/{subreddit}: {changed} of {len(sources)} stored threads have new activity")
+
 
 def main():
-    subreddit = reddit.subreddit(SUBREDDIT)
-    print(f"Scraping top {TOP_POST_LIMIT} posts from r/{SUBREDDIT}...")
-    for idx, submission in enumerate(subreddit.top(limit=TOP_POST_LIMIT)):
-        output_path = os.path.join(OUTPUT_DIR, f"{submission.id}.json")
-        if os.path.exists(output_path):
-            print(f"Skipping duplicate post: {submission.id} (already exists)")
-            continue
-        print(f"[{idx+1}/{TOP_POST_LIMIT}] {submission.title}")
-        post_data = {
-            'id': submission.id,
-            'subreddit': str(submission.subreddit),
-            'author': str(submission.author),
-            'created_utc': submission.created_utc,
-            'title': submission.title,
-            'selftext': submission.selftext,
-            'url': submission.url,
-            'score': submission.score,
-            'num_comments': submission.num_comments,
-            'comments': []
-        }
-        submission.comments.replace_more(limit=None)
-        for comment in submission.comments.list():
-            if isinstance(comment, MoreComments):
-                continue
-            comment_data = {
-                'id': comment.id,
-                'author': str(comment.author),
-                'body': comment.body,
-                'created_utc': comment.created_utc,
-                'score': comment.score,
-                'context': get_comment_context(comment)
-            }
-            post_data['comments'].append(comment_data)
-        # Save each post as a separate JSON file
-        with open(output_path, 'w') as f:
-            json.dump(post_data, f, indent=2)
-        time.sleep(1)  # Add delay to avoid rate limiting
+    parser = argparse.ArgumentParser(description='Scrape subreddit listings with their full comment trees, resumably')
+    parser.add_argument('--subreddits', nargs='+', default=SUBREDDITS)
+    parser.add_argument('--listings', nargs='+', default=['top'], choices=LISTINGS, help='Listings to scrape per subreddit')
+    parser.add_argument('--time_filter', default='all', choices=TIME_FILTERS, help='Time filter of top/controversial listings')
+    parser.add_argument('--limit', type=int, default=TOP_POST_LIMIT, help='Posts per subreddit and listing')
+    parser.add_argument('--database_dir', default=DATABASE_DIR, help='Posts are saved under <database_dir>/<subreddit>/')
+    parser.add_argument('--storage', default='json', choices=STORAGES, help='One JSON file per post, or compressed shards with an id index')
+    parser.add_argument('--progress_log', default=None, help='Write-ahead progress log (default: <database_dir>/.scrape_progress.jsonl)')
+    parser.add_argument('--restart', action='store_true', help='Discard the progress log and list everything again')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Submissions fetched concurrently')
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help='Request budget in requests per second')
+    parser.add_argument('--burst', type=float, default=BURST, help='Requests that may be sent back to back')
+    parser.add_argument('--api_url', default=None, help='Base URL of a stand-in API (see mock_reddit_api.py)')
+    parser.add_argument('--refresh', action='store_true', help='Instead of listing, fetch new comments on already stored threads')
+    args = parser.parse_args()
+
+    limiter = TokenBucket(args.rate, capacity=args.burst)
+    reddit = make_reddit(limiter, args.api_url)
+    if args.refresh:
+        print(f"Refreshing stored threads of {len(args.subreddits)} subreddits with {args.workers} workers...")
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            queue = ScrapeQueue(pool, None, limiter, args.api_url, args.database_dir, args.storage)
+            for subreddit in args.subreddits:
+                refresh_subreddit(queue, reddit, subreddit)
+        queue.close()
+        print(f"Done: {queue.refreshed} threads refreshed with {queue.new_comments} new comments, "
+              f"{queue.failed} failed, {limiter.throttles} rate-limit backoffs")
+        return
+
+    progress_path = args.progress_log or os.path.join(args.database_dir, '.scrape_progress.jsonl')
+    if args.restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+    log = ProgressLog(progress_path)
+    print(f"Scraping {', '.join(args.listings)} of {len(args.subreddits)} subreddits with {args.workers} workers...")
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        queue = ScrapeQueue(pool, log, limiter, args.api_url, args.database_dir, args.storage)
+        for subreddit in args.subreddits:
+            for listing in args.listings:
+                run_job(queue, reddit, subreddit, listing, args.time_filter, args.limit)
+    # Leaving the pool waits for every submission and its progress record
+    queue.close()
+    log.close()
+    print(f"Done: {queue.saved} saved, {queue.failed} failed, {limiter.throttles} rate-limit backoffs")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -1,12 +1,14 @@
 import os
-import json
-import re
-from collections import defaultdict, Counter
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import matplotlib.pyplot as plt
-import datetime
 import nltk
 import textstat
 from nltk.tokenize import word_tokenize, sent_tokenize
+from corpus_index import ANALYSIS_DIR, IGNORE_USERS, INDEX_DIR, EventIndex, load_or_build_index, top_counts
+from time_buckets import bucket
 
 # Ensure nltk data is available
 try:
@@ -14,42 +16,14 @@ try:
 except LookupError:
     nltk.download('punkt')
 
-BASE_DIR = os.path.join(os.path.dirname(__file__), '../database/')
-ANALYSIS_DIR = os.path.join(os.path.dirname(__file__), '../analysis/')
-subreddits = ["AnorexiaNervosa", "ARFID", "bulimia", "EatingDisorders", "fuckeatingdisorders"]
-TARGET_USER = "Sareeee48"
-
-# Aggregate all texts by day
-user_daily_texts = defaultdict(list)
-for subreddit in subreddits:
-    sub_dir = os.path.join(BASE_DIR, subreddit)
-    if not os.path.isdir(sub_dir):
-        continue
-    for fname in os.listdir(sub_dir):
-        if not fname.endswith(".json"):
-            continue
-        with open(os.path.join(sub_dir, fname), "r") as f:
-            data = json.load(f)
-            # Post
-            if data.get("author") == TARGET_USER and data.get("created_utc"):
-                dt = datetime.datetime.utcfromtimestamp(data["created_utc"])
-                date_str = dt.strftime("%Y-%m-%d")
-                text = data.get("selftext", "")
-                if text:
-                    user_daily_texts[date_str].append(text)
-            # Comments
-            for comment in data.get("comments", []):
-                if comment.get("author") == TARGET_USER and comment.get("created_utc"):
-                    dt = datetime.datetime.utcfromtimestamp(comment["created_utc"])
-                    date_str = dt.strftime("%Y-%m-%d")
-                    text = comment.get("body", "")
-                    if text:
-                        user_daily_texts[date_str].append(text)
-
-# Compute metrics per day
-results = []
-for date_str in sorted(user_daily_texts.keys()):
-    texts = user_daily_texts[date_str]
+METRICS = ("total_words", "vocab_size", "lexical_diversity", "avg_sentence_length", "flesch_reading_ease")
+CHUNK_DAYS = 256
+
+_worker_index = None
+
+
+def daily_metrics(texts):
+    """Lexical diversity, sentence length and readability of one day's texts."""
     full_text = "\n".join(texts)
     words = word_tokenize(full_text)
     sentences = sent_tokenize(full_text)
@@ -59,28 +33,55 @@ for date_str in sorted(user_daily_texts.keys()):
     lexical_diversity = vocab_size / total_words if total_words else 0
     avg_sentence_length = total_words / len(sentences) if sentences else 0
     flesch_reading_ease = textstat.flesch_reading_ease(full_text) if full_text.strip() else 0
-    results.append({
-        "date": date_str,
+    return {
         "total_words": total_words,
         "vocab_size": vocab_size,
         "lexical_diversity": lexical_diversity,
         "avg_sentence_length": avg_sentence_length,
         "flesch_reading_ease": flesch_reading_ease
-    })
-
-# Output to CSV
-os.makedirs(ANALYSIS_DIR, exist_ok=True)
-csv_path = os.path.join(ANALYSIS_DIR, f"Sareeee48_semantic_richness_timeseries.csv")
-with open(csv_path, "w", newline='', encoding="utf-8") as csvfile:
-    import csv
-    writer = csv.writer(csvfile)
-    writer.writerow(["date", "total_words", "vocab_size", "lexical_diversity", "avg_sentence_length", "flesch_reading_ease"])
-    for row in results:
-        writer.writerow([row["date"], row["total_words"], row["vocab_size"], f"{row['lexical_diversity']:.3f}", f"{row['avg_sentence_length']:.2f}", f"{row['flesch_reading_ease']:.2f}"])
-print(f"Saved daily semantic richness metrics to {csv_path}")
-
-# Plotting
-if results:
+    }
+
+
+def user_days(index, author_codes):
+    """(author code, date, rows) for every day with text of the given authors, in one pass.
+
+    Days are ordered by author code then date; rows keep index order within a day.
+    """
+    wanted = np.zeros(len(index.authors), dtype=bool)
+    wanted[author_codes] = True
+    rows = np.flatnonzero(wanted[index.author] & (index.created_utc > 0) & (index.text_len > 0))
+    authors = np.asarray(index.author[rows]).astype(np.int64)
+    days = bucket(index.created_utc[rows], 'D')
+    order = np.lexsort((days, authors))
+    rows, authors, days = rows[order], authors[order], days[order]
+    starts = np.flatnonzero(np.concatenate([[True], (authors[1:] != authors[:-1]) | (days[1:] != days[:-1])]))
+    return [(int(authors[s]), str(days[s]), group) for s, group in zip(starts, np.split(rows, starts[1:]))]
+
+
+def _init_worker(index_dir):
+    global _worker_index
+    _worker_index = EventIndex(index_dir)
+
+
+def _chunk_metrics(chunk):
+    return [daily_metrics([_worker_index.text(row) for row in rows]) for _, _, rows in chunk]
+
+
+def compute_metrics(days, index_dir=INDEX_DIR, workers=None):
+    """daily_metrics for every (author, date, rows) day, spread across a process pool."""
+    workers = workers or os.cpu_count() or 1
+    chunks = [days[i:i + CHUNK_DAYS] for i in range(0, len(days), CHUNK_DAYS)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker,
+                                 initargs=(index_dir,)) as pool:
+            partials = list(pool.map(_chunk_metrics, chunks))
+    else:
+        _init_worker(index_dir)
+        partials = [_chunk_metrics(chunk) for chunk in chunks]
+    return [metrics for partial in partials for metrics in partial]
+
+
+def plot_user(user, results, plot_path):
     dates = [row["date"] for row in results]
     lexical_diversity = [row["lexical_diversity"] for row in results]
     vocab_size = [row["vocab_size"] for row in results]
@@ -90,7 +91,7 @@ if results:
     fig, axs = plt.subplots(4, 1, figsize=(18, 16), sharex=True)
     axs[0].plot(dates, lexical_diversity, marker='o')
     axs[0].set_ylabel('Lexical Diversity')
-    axs[0].set_title('Daily Lexical Diversity (Type-Token Ratio)')
+    axs[0].set_title(f'{user}: Daily Lexical Diversity (Type-Token Ratio)')
 
     axs[1].plot(dates, vocab_size, marker='o', color='tab:orange')
     axs[1].set_ylabel('Vocabulary Size')
@@ -106,8 +107,51 @@ if results:
     axs[3].set_xlabel('Date')
     plt.xticks(rotation=45, ha='right')
     plt.tight_layout()
-    plot_path = os.path.join(ANALYSIS_DIR, f"Sareeee48_semantic_richness_timeseries.png")
     plt.savefig(plot_path)
-    print(f"Saved semantic richness timeseries plot to {plot_path}")
-else:
-    print("No data to plot.") 
\ No newline at end of file
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Daily semantic richness metrics per user, as one long users x days table')
+    parser.add_argument('--users', nargs='+', default=None, help='Only these users (default: all users)')
+    parser.add_argument('--top_n', type=int, default=None, help='Only the N most active users')
+    parser.add_argument('--workers', type=int, default=None, help='Metric worker processes (default: CPU count)')
+    parser.add_argument('--plot', action='store_true', help='Plot the time series of each user (use with --users or --top_n)')
+    parser.add_argument('--outdir', default=ANALYSIS_DIR, help='Directory to save outputs')
+    args = parser.parse_args()
+
+    index = load_or_build_index()
+    if args.users:
+        author_codes = [code for code in map(index.author_code, args.users) if code >= 0]
+    elif args.top_n:
+        author_codes, _ = top_counts(index.total_counts * index.valid_authors(IGNORE_USERS), args.top_n)
+    else:
+        author_codes = np.flatnonzero(index.valid_authors(IGNORE_USERS))
+    days = user_days(index, author_codes)
+    print(f"Computing metrics for {len(days)} user-days of {len(set(d[0] for d in days))} users")
+    metrics = compute_metrics(days, workers=args.workers)
+
+    # Output to CSV
+    os.makedirs(args.outdir, exist_ok=True)
+    csv_path = os.path.join(args.outdir, "semantic_richness_timeseries.csv")
+    per_user = {}
+    with open(csv_path, "w", newline='', encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["user", "date"] + list(METRICS))
+        for (code, date, _), row in zip(days, metrics):
+            user = index.authors[code]
+            writer.writerow([user, date, row["total_words"], row["vocab_size"], f"{row['lexical_diversity']:.3f}",
+                             f"{row['avg_sentence_length']:.2f}", f"{row['flesch_reading_ease']:.2f}"])
+            if args.plot:
+                per_user.setdefault(user, []).append(dict(row, date=date))
+    print(f"Saved daily semantic richness metrics to {csv_path}")
+
+    # Plotting
+    for user, results in per_user.items():
+        plot_path = os.path.join(args.outdir, f"{user}_semantic_richness_timeseries.png")
+        plot_user(user, results, plot_path)
+        print(f"Saved semantic richness timeseries plot to {plot_path}")
+
+
+if __name__ == '__main__':
+    main()
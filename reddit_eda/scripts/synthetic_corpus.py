@@ -0,0 +1,181 @@
+"""Synthetic subreddit corpus in the scraper's on-disk layout.
+
+Writes <outdir>/<subreddit>/<post id>.json files shaped exactly like
+scrape_top_posts_and_comments.py output (json.dump with indent=2, each
+comment carrying its inline 'context' of ancestor comments), so every script
+in this directory can be run and timed at sizes the scraped corpus does not
+reach. Authors are drawn from a Zipf distribution, comments per post are
+Poisson, replies nest up to --max_depth and text lengths are lognormal.
+
+    python reddit_eda/scripts/synthetic_corpus.py /tmp/corpus --posts 100000
+
+Post dates fall in the --years before a reference time (--now, default the
+current time, so the reports' lookback windows cover most of them), and
+generation is deterministic for a given --seed and --now regardless of --workers.
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from corpus_index import SUBREDDITS
+
+WORDS = ("food recovery today meal anxious better eat hungry weight body feel good bad day week "
+         "eating disorder therapist binge restrict safe fear help support relapse progress "
+         "breakfast lunch dinner snack calories family friends doctor plan hard proud tired").split()
+CHUNK_POSTS = 1000
+ID_OFFSET = 36 ** 5  # keeps ids at reddit's usual six/seven base-36 digits
+SECONDS_PER_DAY = 86400
+
+
+def base36(n):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    out = ''
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return out
+
+
+def zipf_cdf(n_authors, skew):
+    """Cumulative P(author <= k) with P(author k) proportional to 1 / (k+1)**skew."""
+    cdf = np.cumsum(1.0 / np.arange(1, n_authors + 1) ** skew)
+    return cdf / cdf[-1]
+
+
+class CorpusConfig:
+    def __init__(self, posts=10000, subreddits=SUBREDDITS, comments_mean=8.0, max_depth=6,
+                 reply_prob=0.6, authors=None, zipf=1.1, deleted_fraction=0.03, text_words=45,
+                 years=7, seed=0, now=None):
+        self.posts = posts
+        self.subreddits = list(subreddits)
+        self.comments_mean = comments_mean
+        self.max_depth = max_depth
+        self.reply_prob = reply_prob
+        self.authors = authors or max(100, posts // 2)
+        self.zipf = zipf
+        self.deleted_fraction = deleted_fraction
+        self.text_words = text_words
+        self.years = years
+        self.seed = seed
+        self.now = time.time() if now is None else now
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _text(rng, mean_words):
+    n = int(rng.lognormal(np.log(max(mean_words, 1)) - 0.5, 1.0))
+    if not n:
+        return ''
+    words = np.asarray(WORDS)[rng.integers(0, len(WORDS), n)]
+    sentences = [' '.join(words[i:i + 12]).capitalize() + '.' for i in range(0, n, 12)]
+    return ' '.join(sentences)
+
+
+def _author(rng, config, cdf):
+    if rng.random() < config.deleted_fraction:
+        return 'None'
+    return f"user{min(int(np.searchsorted(cdf, rng.random())), len(cdf) - 1)}"
+
+
+def _write_chunk(args):
+    """Generate and write posts [start, stop); returns (n_posts, n_comments)."""
+    config, outdir, start, stop = args
+    config = CorpusConfig(**config)
+    rng = np.random.default_rng([config.seed, start])
+    cdf = zipf_cdf(config.authors, config.zipf)
+    n_comments = 0
+    for p in range(start, stop):
+        subreddit = config.subreddits[p % len(config.subreddits)]
+        post_id = base36(ID_OFFSET + p)
+        created = float(int(config.now - rng.random() * config.years * 365 * SECONDS_PER_DAY))
+        comments = []
+        depths = []
+        for c in range(rng.poisson(config.comments_mean)):
+            parent = None
+            if comments and rng.random() < config.reply_prob:
+                j = int(rng.integers(0, len(comments)))
+                if depths[j] < config.max_depth:
+                    parent = j
+            context = [] if parent is None else comments[parent]['context'] + [{
+                'id': comments[parent]['id'],
+                'author': comments[parent]['author'],
+                'body': comments[parent]['body'],
+                'created_utc': comments[parent]['created_utc']
+            }]
+            after = comments[parent]['created_utc'] if parent is not None else created
+            comments.append({
+                'id': f"{post_id}{base36(c)}",
+                'author': _author(rng, config, cdf),
+                'body': _text(rng, config.text_words),
+                'created_utc': float(int(after + rng.exponential(2 * SECONDS_PER_DAY))),
+                'score': int(rng.integers(0, 50)),
+                'parent_id': 't3_' + post_id if parent is None else 't1_' + comments[parent]['id'],
+                'link_id': 't3_' + post_id,
+                'context': context
+            })
+            depths.append(0 if parent is None else depths[parent] + 1)
+        n_comments += len(comments)
+        post_data = {
+            'id': post_id,
+            'subreddit': subreddit,
+            'author': _author(rng, config, cdf),
+            'created_utc': created,
+            'title': _text(rng, 10)[:300],
+            'selftext': _text(rng, config.text_words * 2),
+            'url': f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/",
+            'score': int(rng.integers(0, 1000)),
+            'num_comments': len(comments),
+            'comments': comments
+        }
+        with open(os.path.join(outdir, subreddit, f"{post_id}.json"), 'w') as f:
+            json.dump(post_data, f, indent=2)
+    return stop - start, n_comments
+
+
+def generate_corpus(outdir, config, workers=None):
+    """Write config.posts synthetic post files under outdir; returns a summary dict."""
+    for subreddit in config.subreddits:
+        os.makedirs(os.path.join(outdir, subreddit), exist_ok=True)
+    tasks = [(config.as_dict(), outdir, start, min(start + CHUNK_POSTS, config.posts))
+             for start in range(0, config.posts, CHUNK_POSTS)]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            counts = list(pool.map(_write_chunk, tasks))
+    else:
+        counts = [_write_chunk(task) for task in tasks]
+    return {'posts': sum(n for n, _ in counts), 'comments': sum(n for _, n in counts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic corpus in the scraper layout')
+    parser.add_argument('outdir', help='Database directory to create (one subdirectory per subreddit)')
+    parser.add_argument('--posts', type=int, default=10000, help='Number of post files')
+    parser.add_argument('--subreddits', nargs='+', default=SUBREDDITS, help='Subreddit directories to spread posts over')
+    parser.add_argument('--comments_mean', type=float, default=8.0, help='Mean comments per post (Poisson)')
+    parser.add_argument('--max_depth', type=int, default=6, help='Maximum reply depth below a top-level comment')
+    parser.add_argument('--reply_prob', type=float, default=0.6, help='Chance a comment replies to an earlier comment')
+    parser.add_argument('--authors', type=int, default=None, help='Distinct authors (default: posts / 2)')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Author Zipf skew exponent')
+    parser.add_argument('--deleted_fraction', type=float, default=0.03, help="Share of events by deleted ('None') authors")
+    parser.add_argument('--text_words', type=int, default=45, help='Typical comment length in words (lognormal)')
+    parser.add_argument('--years', type=float, default=7, help='Spread post dates over the last N years')
+    parser.add_argument('--now', type=float, default=None, help='Reference epoch time the dates lead up to (default: now)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='Writer processes (default: CPU count)')
+    args = parser.parse_args()
+
+    config = CorpusConfig(posts=args.posts, subreddits=args.subreddits, comments_mean=args.comments_mean,
+                          max_depth=args.max_depth, reply_prob=args.reply_prob, authors=args.authors,
+                          zipf=args.zipf, deleted_fraction=args.deleted_fraction, text_words=args.text_words,
+                          years=args.years, seed=args.seed, now=args.now)
+    summary = generate_corpus(args.outdir, config, workers=args.workers)
+    print(f"Wrote {summary['posts']} posts with {summary['comments']} comments to {args.outdir} (--now {config.now:.0f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Per-thread comment tables with memoized ancestor chains.
+
+Timelines used to copy every ancestor comment into each reply's 'context',
+which is O(d^2) work and text for a reply chain of depth d. Instead a reply's
+context is stored as a reference,
+
+    {'thread': <post id>, 'ancestors': [<comment id>, ...]}   (root first)
+
+and each referenced ancestor comment is written once per thread to a thread
+store (threads.jsonl plus a threads.index.json of byte offsets) next to the
+timelines. Readers materialize the old inline context only when they need it:
+
+    store = ThreadStore(find_thread_store(timeline_path))
+    for event in iter_timeline(timeline_path, store):
+        event['context']  # list of {'id', 'author', 'body', 'created_utc'} or None
+"""
+import os
+import json
+from corpus_index import COMMENT
+
+
+class Thread:
+    """Comment table of one post, with ancestor chains computed once per comment."""
+
+    def __init__(self, post_id, comments):
+        self.post_id = post_id
+        self.comments = comments  # {comment_id: {'id', 'author', 'body', 'created_utc', 'parent_id'}}
+        self._chains = {}
+
+    def ancestors(self, parent_id):
+        """Ancestor comment ids, root first, for a comment whose parent is parent_id.
+
+        The walk stops at the post or at a parent missing from the table, like
+        the original build_comment_context.
+        """
+        path = []
+        chain = ()
+        current = parent_id
+        while current and current.startswith('t1_'):
+            comment_id = current[3:]
+            if comment_id in self._chains:
+                chain = self._chains[comment_id]
+                break
+            if comment_id not in self.comments or comment_id in path:
+                break
+            path.append(comment_id)
+            current = self.comments[comment_id]['parent_id']
+        for comment_id in reversed(path):
+            chain = chain + (comment_id,)
+            self._chains[comment_id] = chain
+        return chain
+
+    def context(self, chain):
+        """Inline context records for an ancestor chain."""
+        return [{
+            'id': self.comments[comment_id]['id'],
+            'author': self.comments[comment_id]['author'],
+            'body': self.comments[comment_id]['body'],
+            'created_utc': self.comments[comment_id]['created_utc']
+        } for comment_id in chain]
+
+
+def load_thread(index, file_code):
+    """Build the comment table of one post file from the event index."""
+    comments = {}
+    post_id = None
+    for row in index.file_rows(file_code):
+        post_id = str(index.post_id[row])
+        if index.type[row] == COMMENT and index.comment_id[row]:
+            comments[str(index.comment_id[row])] = {
+                'id': str(index.comment_id[row]),
+                'author': index.authors[index.author[row]],
+                'body': index.text(row),
+                'created_utc': float(index.created_utc[row]),
+                'parent_id': str(index.parent_id[row]) or None
+            }
+    return Thread(post_id, comments)
+
+
+class ThreadStoreWriter:
+    """Appends the referenced comments of each thread to a thread store."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self._offsets = {}
+
+    def write_thread(self, thread, comment_ids):
+        if not comment_ids:
+            return
+        record = {
+            'thread': thread.post_id,
+            'comments': {cid: {k: v for k, v in thread.comments[cid].items() if k != 'parent_id'}
+                         for cid in sorted(comment_ids)}
+        }
+        # A thread can be written more than once if its rows are not
+        # contiguous in the index; readers merge the records.
+        self._offsets.setdefault(thread.post_id, []).append(self._file.tell())
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self._file.close()
+        with open(_index_path(self.path), 'w') as f:
+            json.dump(self._offsets, f)
+
+
+def _index_path(store_path):
+    return os.path.splitext(store_path)[0] + '.index.json'
+
+
+class ThreadStore:
+    """Random-access reader for a thread store."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(_index_path(path), 'r') as f:
+            self._offsets = json.load(f)
+        self._file = open(path, 'r', encoding='utf-8')
+        self._cache_key = None
+        self._cache = None
+
+    def comments(self, post_id):
+        if post_id != self._cache_key:
+            comments = {}
+            for offset in self._offsets.get(post_id, []):
+                self._file.seek(offset)
+                comments.update(json.loads(self._file.readline())['comments'])
+            self._cache_key, self._cache = post_id, comments
+        return self._cache
+
+    def materialize(self, context):
+        """Expand a context reference into the inline list of ancestor records."""
+        if not context or isinstance(context, list):
+            return context  # None or already inline
+        comments = self.comments(context['thread'])
+        return [dict(comments[cid], id=cid) for cid in context['ancestors']]
+
+
+def find_thread_store(timeline_path):
+    """The thread store for a timeline: <user>_threads.jsonl or threads.jsonl beside it."""
+    directory = os.path.dirname(timeline_path)
+    user = os.path.basename(timeline_path).split('_full_timeline')[0]
+    for name in (f'{user}_threads.jsonl', 'threads.jsonl'):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def iter_timeline(timeline_path, store=None):
+    """Yield timeline events, with context materialized when a store is given."""
+    with open(timeline_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            event = json.loads(line)
+            if store is not None:
+                event['context'] = store.materialize(event.get('context'))
+            yield event
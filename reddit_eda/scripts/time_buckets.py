@@ -0,0 +1,80 @@
+"""Vectorized time bucketing for corpus timestamps.
+
+Works on whole arrays of epoch seconds (created_utc) instead of building a
+datetime and an f"{year}-{month:02d}" string per event. Buckets are NumPy
+datetime64 values:
+
+    'D'  calendar day                 datetime64[D]
+    'M'  calendar month               datetime64[M]
+
+bucket_matrix() turns (user, bucket) columns into the dense users x buckets
+matrix the time-series reports plot.
+"""
+import datetime
+import numpy as np
+
+FREQS = ('D', 'M')
+SECONDS_PER_DAY = 86400
+DEFAULT_LOOKBACK_DAYS = 5 * 365
+
+
+def to_datetime64(created_utc):
+    """Epoch seconds (float or int) as datetime64[s]."""
+    return np.asarray(created_utc).astype(np.int64).astype('datetime64[s]')
+
+
+def bucket(created_utc, freq):
+    """Bucket of every timestamp in created_utc at the given frequency."""
+    days = to_datetime64(created_utc).astype('datetime64[D]')
+    if freq == 'D':
+        return days
+    if freq == 'M':
+        return days.astype('datetime64[M]')
+    raise ValueError(f"Unknown bucket frequency {freq!r}; expected one of {FREQS}")
+
+
+def window_start(lookback_days=DEFAULT_LOOKBACK_DAYS, now=None):
+    """Epoch seconds of the start of a look-back window ending at now (UTC)."""
+    if now is None:
+        now = utc_now()
+    return now - lookback_days * SECONDS_PER_DAY
+
+
+def utc_now():
+    """Current time as epoch seconds, matching the scripts' naive utcnow()."""
+    return (datetime.datetime.utcnow() - datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+def bucket_range(start, end, freq):
+    """Every bucket from the one containing start to the one containing end."""
+    first, last = bucket(np.array([start, end]), freq)
+    return np.arange(first, last + np.timedelta64(1, freq))
+
+
+def bucket_labels(buckets):
+    """Display labels: 'YYYY-MM-DD' or 'YYYY-MM'."""
+    return [str(b) for b in buckets]
+
+
+def bucket_matrix(user_codes, event_buckets, users, buckets, weights=None):
+    """Dense len(users) x len(buckets) sums of weights (default: counts).
+
+    Events whose user is not in users or whose bucket is not in buckets
+    (a sorted datetime64 array, e.g. from bucket_range) are ignored.
+    """
+    users = np.asarray(users, dtype=np.int64)
+    user_codes = np.asarray(user_codes, dtype=np.int64)
+    matrix = np.zeros((len(users), len(buckets)), dtype=np.float64 if weights is not None else np.int64)
+    if not len(users) or not len(buckets) or not len(user_codes):
+        return matrix
+    row_of = np.full(max(users.max(), user_codes.max()) + 1, -1, dtype=np.int64)
+    row_of[users] = np.arange(len(users))
+    rows = row_of[user_codes]
+    cols = np.searchsorted(buckets, event_buckets)
+    keep = (rows >= 0) & (cols < len(buckets))
+    keep[keep] = buckets[cols[keep]] == event_buckets[keep]
+    flat = rows[keep] * len(buckets) + cols[keep]
+    w = None if weights is None else np.asarray(weights)[keep]
+    matrix += np.bincount(flat, weights=w, minlength=matrix.size).reshape(matrix.shape).astype(matrix.dtype)
+    return matrix
+